@@ -1,12 +1,40 @@
+from concurrent.futures import ThreadPoolExecutor
 from passlib.context import CryptContext
+from typing import Optional, Tuple
+import asyncio
+import os
 
-# Password hashing context
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Password hashing configuration
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS", "4"))
 
-def hash_password(password: str) -> str:
+# Password hashing context; hashes made with any other cost are rehashed on login
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+# bcrypt releases the GIL, so a small thread pool keeps it off the event loop
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="bcrypt")
+_semaphore = asyncio.Semaphore(PASSWORD_HASH_WORKERS)
+
+async def _run(func, *args):
+    """Run a password operation on the bcrypt pool, at most one per worker at a time"""
+    async with _semaphore:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_executor, func, *args)
+
+async def hash_password(password: str) -> str:
     """Hash a password using bcrypt"""
-    return pwd_context.hash(password)
+    return await _run(pwd_context.hash, password)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    return await _run(pwd_context.verify, plain_password, hashed_password)
+
+async def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """Verify a password and return a new hash if the stored one uses a different cost"""
+    return await _run(pwd_context.verify_and_update, plain_password, hashed_password)
@@ -0,0 +1,277 @@
+"""Benchmark API endpoints in-process against an in-memory Mongo stand-in.
+
+Builds the app with create_app() on a mongomock-motor database, seeds couples with
+realistic volumes, drives every route through an ASGI client and reports
+p50/p95/p99 latency, throughput and peak RSS per endpoint as JSON.
+
+Usage:
+    python benchmarks/endpoints.py --output bench.json
+    python benchmarks/endpoints.py --baseline bench.json   # fail on p95 regressions
+"""
+from datetime import datetime, timedelta
+from pathlib import Path
+import argparse
+import asyncio
+import io
+import json
+import logging
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+
+# Services read their configuration at import time
+os.environ.setdefault("MONGO_URL", "mongodb://benchmark.invalid:27017")
+os.environ.setdefault("DB_NAME", "benchmark")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+# Every request comes from one client, which admission control would throttle
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+os.environ.setdefault("BLOB_STORAGE_BACKEND", "local")
+os.environ.setdefault("BLOB_STORAGE_DIR", tempfile.mkdtemp(prefix="benchmark-blobs-"))
+
+# Add backend directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import httpx
+from mongomock_motor import AsyncMongoMockClient
+
+from server import create_app
+from models.letter import Letter
+from models.mood import Mood
+from models.photo import Photo
+from services.db_indexes import ensure_indexes
+from storage.blob_store import get_blob_store
+
+# One log line per request would dominate the timings
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def current_rss_bytes() -> int:
+    """Resident set size of this process, from /proc where available"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # ru_maxrss is the lifetime peak (KiB on Linux), the best we can do elsewhere
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def make_photo_bytes(megabytes: float) -> bytes:
+    """Encode a noisy JPEG of roughly the requested size"""
+    from PIL import Image
+
+    side = int((megabytes * 1024 * 1024 / 1.5) ** 0.5)
+    image = Image.frombytes("RGB", (side, side), os.urandom(side * side * 3))
+    buffer = io.BytesIO()
+    image.save(buffer, format="JPEG", quality=95)
+    return buffer.getvalue()
+
+async def single_chunk(data: bytes):
+    yield data
+
+async def seed_couple(client: httpx.AsyncClient, db, index: int, args) -> dict:
+    """Register and link a couple, then bulk-insert their history"""
+    users = []
+    for role in ("boyfriend", "girlfriend"):
+        username = f"bench-{index}-{role}"
+        credentials = {"username": username, "password": "benchmark-password"}
+        response = await client.post("/api/auth/register", json={
+            **credentials, "role": role, "display_name": username, "anniversary_date": "2020-02-14"
+        })
+        response.raise_for_status()
+        users.append((response.json(), credentials))
+
+    (boyfriend, boyfriend_login), (girlfriend, _) = users
+    token = (await client.post("/api/auth/login", json=boyfriend_login)).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+    (await client.post(
+        "/api/auth/link-partner", json={"partner_username": girlfriend["username"]}, headers=headers
+    )).raise_for_status()
+
+    me = (await client.get("/api/auth/me", headers=headers)).json()
+    couple_id = (await db.users.find_one({"id": me["id"]}))["couple_id"]
+    await db.users.update_many({"couple_id": couple_id}, {"$unset": {"couple_pending": ""}})
+    from services.couple_context import couple_cache
+    couple_cache.invalidate(boyfriend["id"], girlfriend["id"])
+
+    now = datetime.utcnow()
+    partners = [boyfriend, girlfriend]
+
+    letters = []
+    for i in range(args.letters):
+        sender = partners[i % 2]
+        letters.append(Letter(
+            title=f"Letter {i}",
+            content="I love you more every day. " * random.randint(5, 60),
+            from_user_id=sender["id"],
+            from_name=sender["display_name"],
+            to_user_id=partners[(i + 1) % 2]["id"],
+            couple_id=couple_id,
+            created_at=now - timedelta(minutes=i)
+        ).dict())
+    await db.letters.insert_many(letters)
+
+    moods = []
+    for i in range(args.moods):
+        author = partners[i % 2]
+        moods.append(Mood(
+            user_id=author["id"],
+            username=author["username"],
+            role=author["role"],
+            mood=random.choice(["happy", "loved", "tired", "excited"]),
+            emoji="💕",
+            note=f"Mood {i}",
+            couple_id=couple_id,
+            created_at=now - timedelta(minutes=i)
+        ).dict())
+    await db.moods.insert_many(moods)
+
+    store = get_blob_store(db)
+    photo_bytes = make_photo_bytes(args.photo_mb)
+    blob = await store.put(single_chunk(photo_bytes))
+    photos = [Photo(
+        blob_key=blob.key,
+        content_type="image/jpeg",
+        size=blob.size,
+        caption=f"Photo {i}",
+        date="2024-01-01",
+        uploaded_by=partners[i % 2]["id"],
+        uploader_name=partners[i % 2]["display_name"],
+        couple_id=couple_id,
+        created_at=now - timedelta(hours=i)
+    ).dict() for i in range(args.photos)]
+    await db.photos.insert_many(photos)
+
+    return {"headers": headers, "photo_id": photos[0]["id"]}
+
+def scenarios(couple: dict):
+    """Requests to time, keyed by endpoint name"""
+    photo_url = f"/api/photos/{couple['photo_id']}/content"
+    return {
+        "GET /api/auth/me": ("GET", "/api/auth/me", {}),
+        "GET /api/letters": ("GET", "/api/letters", {"params": {"limit": 50}}),
+        "GET /api/letters?limit=200": ("GET", "/api/letters", {"params": {"limit": 200}}),
+        "GET /api/moods": ("GET", "/api/moods", {"params": {"limit": 50}}),
+        "GET /api/moods/latest": ("GET", "/api/moods/latest", {}),
+        "GET /api/photos": ("GET", "/api/photos", {"params": {"limit": 50}}),
+        "GET /api/photos/{id}/content": ("GET", photo_url, {}),
+        "GET /api/photos/{id}/content (range)": ("GET", photo_url, {"headers": {"Range": "bytes=0-65535"}}),
+        "GET /api/questions/daily": ("GET", "/api/questions/daily", {}),
+        "GET /api/notifications": ("GET", "/api/notifications", {}),
+        "GET /api/notifications/unread/count": ("GET", "/api/notifications/unread/count", {}),
+        "POST /api/moods": ("POST", "/api/moods", {"json": {"mood": "happy", "emoji": "😊", "note": "bench"}}),
+        "POST /api/letters": ("POST", "/api/letters", {"json": {"title": "Bench", "content": "Hi", "to_user_id": "x"}}),
+    }
+
+async def run_endpoint(client: httpx.AsyncClient, couple: dict, request, args) -> dict:
+    """Fire a fixed number of requests at one endpoint and summarize them"""
+    method, url, kwargs = request
+    headers = {**couple["headers"], **kwargs.get("headers", {})}
+    kwargs = {key: value for key, value in kwargs.items() if key != "headers"}
+    latencies = []
+    peak_rss = current_rss_bytes()
+    remaining = args.requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            response = await client.request(method, url, headers=headers, **kwargs)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code >= 400:
+                raise RuntimeError(f"{method} {url} returned {response.status_code}: {response.text[:200]}")
+
+    async def sample_rss(stop: asyncio.Event):
+        nonlocal peak_rss
+        while not stop.is_set():
+            peak_rss = max(peak_rss, current_rss_bytes())
+            await asyncio.sleep(0.01)
+
+    stop = asyncio.Event()
+    sampler = asyncio.create_task(sample_rss(stop))
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await sampler
+
+    return {
+        "requests": len(latencies),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1),
+        "peak_rss_mb": round(peak_rss / (1024 * 1024), 1),
+    }
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """List endpoints whose p95 regressed beyond the tolerance"""
+    regressions = []
+    for name, result in results["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(name)
+        if before and result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {before['p95_ms']}ms -> {result['p95_ms']}ms")
+    return regressions
+
+async def main(args) -> int:
+    # The ASGI transport skips the lifespan, so open the stand-in database here
+    app = create_app()
+    db = app.state.db = AsyncMongoMockClient()[os.environ["DB_NAME"]]
+    await ensure_indexes(db)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        couples = [await seed_couple(client, db, i, args) for i in range(args.couples)]
+        couple = couples[0]
+
+        # Warm caches and code paths once before measuring
+        for request in scenarios(couple).values():
+            await client.request(request[0], request[1], headers=couple["headers"], **{
+                key: value for key, value in request[2].items() if key != "headers"
+            })
+
+        endpoints = {}
+        for name, request in scenarios(couple).items():
+            if args.only and args.only not in name:
+                continue
+            endpoints[name] = await run_endpoint(client, couple, request, args)
+            print(f"{name}: {endpoints[name]}", file=sys.stderr)
+
+    results = {
+        "created_at": datetime.utcnow().isoformat(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        "endpoints": endpoints,
+    }
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        Path(args.output).write_text(output)
+    else:
+        print(output)
+
+    if args.baseline:
+        regressions = compare(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--couples", type=int, default=2)
+    parser.add_argument("--letters", type=int, default=3000, help="letters per couple")
+    parser.add_argument("--moods", type=int, default=3000, help="moods per couple")
+    parser.add_argument("--photos", type=int, default=20, help="photos per couple")
+    parser.add_argument("--photo-mb", type=float, default=3.0, help="approximate size of each photo")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--only", help="only run endpoints whose name contains this")
+    parser.add_argument("--output", help="write results JSON here instead of stdout")
+    parser.add_argument("--baseline", help="results JSON to compare p95 latencies against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 regression (0.2 = 20%%)")
+    sys.exit(asyncio.run(main(parser.parse_args())))
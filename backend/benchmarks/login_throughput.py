@@ -0,0 +1,80 @@
+"""Measure how a burst of logins affects latency of other endpoints.
+
+Runs against a live server. While LOGIN_WORKERS threads log in as fast as
+they can, a probe thread hits a cheap authenticated endpoint and records
+its latency.
+
+Usage: BASE_URL=http://localhost:8001 python benchmarks/login_throughput.py
+"""
+from concurrent.futures import ThreadPoolExecutor
+import os
+import statistics
+import threading
+import time
+import uuid
+
+import requests
+
+BASE_URL = os.environ.get("BASE_URL", "http://localhost:8001")
+LOGIN_WORKERS = int(os.environ.get("LOGIN_WORKERS", "16"))
+DURATION_SECONDS = float(os.environ.get("DURATION_SECONDS", "10"))
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+def summary(name, samples):
+    return (
+        f"{name}: n={len(samples)} p50={percentile(samples, 50) * 1000:.1f}ms "
+        f"p99={percentile(samples, 99) * 1000:.1f}ms max={max(samples) * 1000:.1f}ms"
+    )
+
+def main():
+    api = f"{BASE_URL}/api"
+    username = f"bench-{uuid.uuid4().hex[:8]}"
+    credentials = {"username": username, "password": "benchmark-password"}
+
+    requests.post(f"{api}/auth/register", json={
+        **credentials, "role": "boyfriend", "display_name": "Bench"
+    }).raise_for_status()
+    token = requests.post(f"{api}/auth/login", json=credentials).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    def probe(stop, samples):
+        session = requests.Session()
+        while not stop.is_set():
+            start = time.perf_counter()
+            session.get(f"{api}/auth/me", headers=headers).raise_for_status()
+            samples.append(time.perf_counter() - start)
+
+    def login(stop, samples):
+        session = requests.Session()
+        while not stop.is_set():
+            start = time.perf_counter()
+            session.post(f"{api}/auth/login", json=credentials).raise_for_status()
+            samples.append(time.perf_counter() - start)
+
+    # Baseline: probe latency with no logins in flight
+    stop, idle = threading.Event(), []
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        pool.submit(probe, stop, idle)
+        time.sleep(DURATION_SECONDS / 2)
+        stop.set()
+
+    # Under load: the same probe while logins run concurrently
+    stop, loaded, logins = threading.Event(), [], []
+    with ThreadPoolExecutor(max_workers=LOGIN_WORKERS + 1) as pool:
+        pool.submit(probe, stop, loaded)
+        for _ in range(LOGIN_WORKERS):
+            pool.submit(login, stop, logins)
+        time.sleep(DURATION_SECONDS)
+        stop.set()
+
+    print(summary("GET /auth/me (idle)", idle))
+    print(summary("GET /auth/me (during logins)", loaded))
+    print(summary("POST /auth/login", logins))
+    print(f"login throughput: {len(logins) / DURATION_SECONDS:.1f}/s "
+          f"(median {statistics.median(logins) * 1000:.1f}ms)")
+
+if __name__ == "__main__":
+    main()
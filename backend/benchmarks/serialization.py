@@ -0,0 +1,65 @@
+"""Compare CPU cost of the old and new response serialization paths.
+
+Old: XResponse(**doc) per row, FastAPI re-validates against response_model,
+jsonable_encoder, then json.dumps. New: model_construct per row rendered
+by orjson through FastJSONResponse.
+
+Usage: python benchmarks/serialization.py
+"""
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import List
+import json
+import sys
+import timeit
+import uuid
+
+# Add backend directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+from models.letter import LetterResponse
+from services.serialization import FastJSONResponse, from_docs
+
+ROWS = 1000
+ROUNDS = 20
+
+def make_docs():
+    now = datetime.utcnow()
+    return [{
+        "_id": uuid.uuid4().hex,
+        "id": str(uuid.uuid4()),
+        "title": f"Letter {i}",
+        "content": "I love you more every day. " * 20,
+        "from_user_id": str(uuid.uuid4()),
+        "from_name": "Cookie",
+        "to_user_id": str(uuid.uuid4()),
+        "couple_id": str(uuid.uuid4()),
+        "created_at": now - timedelta(minutes=i),
+    } for i in range(ROWS)]
+
+def main():
+    docs = make_docs()
+    response_field = TypeAdapter(List[LetterResponse])
+
+    def old_path():
+        models = [LetterResponse(**doc) for doc in docs]
+        validated = response_field.validate_python([model.model_dump() for model in models])
+        return json.dumps(jsonable_encoder(validated)).encode()
+
+    def new_path():
+        return FastJSONResponse(from_docs(LetterResponse, docs)).body
+
+    assert json.loads(old_path()) == json.loads(new_path())
+
+    old = min(timeit.repeat(old_path, number=1, repeat=ROUNDS))
+    new = min(timeit.repeat(new_path, number=1, repeat=ROUNDS))
+    print(f"{ROWS} letters, best of {ROUNDS}")
+    print(f"  old path: {old * 1000:.2f} ms")
+    print(f"  new path: {new * 1000:.2f} ms")
+    print(f"  saved:    {(old - new) * 1000:.2f} ms per request ({old / new:.1f}x faster)")
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,16 @@
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from auth.jwt_handler import decode_token
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from services.couple_context import get_couple_context
+from services.database import get_db
 from typing import Optional
 
 security = HTTPBearer()
 
 async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security)
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ) -> dict:
     """
     Middleware to get current user from JWT token
@@ -29,11 +33,24 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Return user info from token
+    # Partner links change after login, so read them from the couple context
+    context = await get_couple_context(db, user_id)
+    if context is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid authentication credentials",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    
+    user = context["user"]
     return {
         "id": user_id,
-        "username": payload.get("username"),
-        "role": payload.get("role"),
-        "display_name": payload.get("display_name"),
-        "partner_id": payload.get("partner_id")
+        "username": user["username"],
+        "role": user["role"],
+        "display_name": user["display_name"],
+        "partner_id": context["partner_id"],
+        "partner_name": context["partner_name"],
+        "couple_id": user.get("couple_id"),
+        "couple_pending": user.get("couple_pending", False),
+        "context": context
     }
@@ -0,0 +1,45 @@
+from services.metrics import HTTP_REQUEST_DURATION, HTTP_REQUESTS_IN_FLIGHT, HTTP_RESPONSE_SIZE
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+import time
+
+class MetricsMiddleware:
+    """Record latency, response size and in-flight count for every HTTP request
+
+    Requests are labelled by route template (/api/photos/{photo_id}/content)
+    rather than raw path so ids don't blow up the label space.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+        response_size = 0
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code, response_size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                response_size += len(message.get("body", b""))
+            await send(message)
+
+        HTTP_REQUESTS_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_REQUESTS_IN_FLIGHT.dec()
+            # The router records the matched route on the scope while dispatching
+            route = scope.get("route")
+            labels = {
+                "method": scope["method"],
+                "route": getattr(route, "path", "unmatched"),
+                "status": str(status_code),
+            }
+            HTTP_REQUEST_DURATION.observe(time.perf_counter() - started, **labels)
+            HTTP_RESPONSE_SIZE.observe(response_size, **labels)
@@ -0,0 +1,144 @@
+from fastapi import HTTPException, status
+from auth.jwt_handler import decode_token
+from services.metrics import HTTP_REQUESTS_REJECTED
+from services.rate_limit import RateLimiter, client_ip, rate_limiter, route_group
+from services.serialization import FastJSONResponse
+from starlette.datastructures import Headers
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from typing import List, Optional
+import orjson
+
+class RequestTooLarge(Exception):
+    """A body read up front went past its group's size limit"""
+
+class RateLimitMiddleware:
+    """Admit requests through per-IP and per-user token buckets, a concurrency cap and a body size limit
+
+    Each route group (auth, uploads, writes, reads) has its own limits.
+    Bodies are counted as they stream in, so an oversized upload is cut
+    off without ever being buffered in full.
+    """
+
+    def __init__(self, app: ASGIApp, limiter: RateLimiter = rate_limiter):
+        self.app = app
+        self.limiter = limiter
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        group = route_group(scope["method"], scope["path"]) if scope["type"] == "http" else None
+        if group is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = Headers(scope=scope)
+
+        # A declared oversized body is refused before it costs the client a token
+        max_body = self.limiter.policies[group].max_body
+        content_length = headers.get("content-length")
+        if content_length and content_length.isdigit() and int(content_length) > max_body:
+            await self.reject_body(scope, receive, send, group, max_body)
+            return
+
+        client = scope.get("client")
+        ip = client_ip(client[0] if client else None, headers.get("x-forwarded-for"))
+        rejection = self.limiter.check_ip(group, ip)
+        if rejection is not None:
+            await self.reject(scope, receive, send, group, rejection)
+            return
+
+        if group == "auth":
+            # Nobody is logged in yet, so limit attempts per submitted username from this IP
+            try:
+                messages = await read_body(receive, max_body)
+            except RequestTooLarge:
+                await self.reject_body(scope, receive, send, group, max_body)
+                return
+            username = submitted_username(b"".join(message.get("body", b"") for message in messages))
+            user_key = f"{username.lower()}|{ip}" if username else None
+            receive = replay(messages, receive)
+        else:
+            user_key = bearer_user_id(headers)
+
+        rejection = self.limiter.check_user(group, user_key)
+        if rejection is not None:
+            await self.reject(scope, receive, send, group, rejection)
+            return
+
+        received = 0
+
+        async def receive_limited() -> Message:
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > max_body:
+                    # Chunked bodies carry no length up front; the app turns this into a 413
+                    HTTP_REQUESTS_REJECTED.inc(group=group, reason="body_size")
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"Request body can be at most {max_body} bytes"
+                    )
+            return message
+
+        self.limiter.acquire(group)
+        try:
+            await self.app(scope, receive_limited, send)
+        finally:
+            self.limiter.release(group)
+
+    async def reject(self, scope: Scope, receive: Receive, send: Send, group: str, rejection: tuple):
+        reason, retry_after = rejection
+        HTTP_REQUESTS_REJECTED.inc(group=group, reason=reason)
+        response = FastJSONResponse(
+            {"detail": "Too many requests, please retry later"},
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            headers={"Retry-After": str(retry_after)}
+        )
+        await response(scope, receive, send)
+
+    async def reject_body(self, scope: Scope, receive: Receive, send: Send, group: str, max_body: int):
+        HTTP_REQUESTS_REJECTED.inc(group=group, reason="body_size")
+        response = FastJSONResponse(
+            {"detail": f"Request body can be at most {max_body} bytes"},
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+        )
+        await response(scope, receive, send)
+
+async def read_body(receive: Receive, max_body: int) -> List[Message]:
+    """Read a whole, small request body up front, keeping its messages to replay"""
+    messages = []
+    received = 0
+    while True:
+        message = await receive()
+        messages.append(message)
+        if message["type"] != "http.request":
+            return messages
+        received += len(message.get("body", b""))
+        if received > max_body:
+            raise RequestTooLarge()
+        if not message.get("more_body", False):
+            return messages
+
+def replay(messages: List[Message], receive: Receive) -> Receive:
+    """A receive that yields already-read messages before reading on"""
+    pending = list(messages)
+
+    async def receive_replayed() -> Message:
+        if pending:
+            return pending.pop(0)
+        return await receive()
+    return receive_replayed
+
+def submitted_username(body: bytes) -> Optional[str]:
+    try:
+        username = orjson.loads(body).get("username")
+    except (orjson.JSONDecodeError, AttributeError):
+        return None
+    return username if isinstance(username, str) and username else None
+
+def bearer_user_id(headers: Headers) -> Optional[str]:
+    """The user a request is authenticated as, only if its token verifies"""
+    scheme, _, token = headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    payload = decode_token(token)
+    return payload.get("sub") if payload else None
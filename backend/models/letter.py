@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
+from typing import Optional
 import uuid
 
 class LetterCreate(BaseModel):
@@ -14,6 +15,7 @@ class Letter(BaseModel):
     from_user_id: str
     from_name: str
     to_user_id: str
+    couple_id: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class LetterResponse(BaseModel):
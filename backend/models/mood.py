@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
+from typing import Dict, List, Optional
 import uuid
 
 class MoodCreate(BaseModel):
@@ -15,6 +16,7 @@ class Mood(BaseModel):
     mood: str
     emoji: str
     note: str
+    couple_id: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class MoodResponse(BaseModel):
@@ -26,3 +28,30 @@ class MoodResponse(BaseModel):
     emoji: str
     note: str
     created_at: datetime
+
+class MoodUserStats(BaseModel):
+    user_id: str
+    total: int
+    active_days: int
+    current_streak: int  # consecutive days with a mood, up to today or yesterday
+    longest_streak: int
+    distribution: Dict[str, float]  # share of the user's moods per mood
+    top_emojis: List[str]
+    daily_totals: List[int]  # one entry per day in the range
+    daily_moods: List[Optional[str]]  # most shared mood of each day
+
+class MoodAlignment(BaseModel):
+    shared_days: int  # days both partners shared a mood
+    same_mood_days: int
+    agreement: Optional[float] = None  # same_mood_days / shared_days
+    similarity: Optional[float] = None  # mean cosine similarity of shared days' moods
+    current_streak: int
+    longest_streak: int
+
+class MoodStats(BaseModel):
+    range: str
+    start: str
+    end: str
+    days: List[str]
+    users: List[MoodUserStats]
+    alignment: Optional[MoodAlignment] = None
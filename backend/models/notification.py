@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
+from typing import List, Literal, Optional, Union
 import uuid
 
 class Notification(BaseModel):
@@ -9,6 +10,7 @@ class Notification(BaseModel):
     message: str
     date: str
     read: bool = False
+    dedup_key: Optional[str] = None  # unique per user, makes generation idempotent
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class NotificationResponse(BaseModel):
@@ -19,3 +21,6 @@ class NotificationResponse(BaseModel):
     date: str
     read: bool
     created_at: datetime
+
+class NotificationsMarkRead(BaseModel):
+    ids: Union[Literal["all"], List[str]] = Field(..., max_length=500)  # notification ids, or "all"
@@ -1,26 +1,41 @@
 from pydantic import BaseModel, Field
+from typing import Dict, Optional
 from datetime import datetime
 import uuid
 
-class PhotoCreate(BaseModel):
-    image_base64: str
-    caption: str
-    date: str
+class PhotoDerivative(BaseModel):
+    blob_key: str
+    content_type: str
+    size: int
+    width: int
+    height: int
 
 class Photo(BaseModel):
     id: str = Field(default_factory=lambda: str(uuid.uuid4()))
-    image_base64: str
+    blob_key: str
+    content_type: str
+    size: int
+    width: Optional[int] = None
+    height: Optional[int] = None
+    derivatives: Dict[str, PhotoDerivative] = {}
     caption: str
     date: str
     uploaded_by: str
     uploader_name: str
+    couple_id: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class PhotoResponse(BaseModel):
     id: str
-    image_base64: str
     caption: str
     date: str
     uploaded_by: str
     uploader_name: str
+    content_type: Optional[str] = None
+    size: Optional[int] = None
+    width: Optional[int] = None
+    height: Optional[int] = None
+    content_url: str
+    medium_url: Optional[str] = None
+    original_url: str
     created_at: datetime
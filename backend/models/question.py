@@ -1,5 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
+from typing import Optional
 import uuid
 
 class Question(BaseModel):
@@ -25,6 +26,7 @@ class Answer(BaseModel):
     username: str
     role: str
     answer_text: str
+    couple_id: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
 class AnswerResponse(BaseModel):
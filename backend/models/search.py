@@ -0,0 +1,14 @@
+from pydantic import BaseModel
+from datetime import datetime
+from typing import List, Optional
+
+class SearchResult(BaseModel):
+    id: str  # id of the matching letter or answer
+    kind: str  # 'letter', 'answer'
+    title: Optional[str] = None
+    snippet: str
+    highlights: List[List[int]]  # [start, end) offsets of matched words in the snippet
+    author_id: str
+    question_id: Optional[str] = None
+    score: float
+    created_at: datetime
@@ -27,7 +27,9 @@ class User(BaseModel):
     role: str
     display_name: str
     partner_id: Optional[str] = None
+    couple_id: str = Field(default_factory=lambda: str(uuid.uuid4()))
     anniversary_date: Optional[str] = None
+    anniversary_md: Optional[str] = None  # "MM-DD", for the daily anniversary lookup
     relationship_start: Optional[str] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -1,21 +1,23 @@
 from fastapi import APIRouter, HTTPException, status, Depends
 from models.user import UserRegister, UserLogin, User, UserResponse, LoginResponse, LinkPartner
-from auth.password_utils import hash_password, verify_password
+from auth.password_utils import hash_password, verify_and_update_password
 from auth.jwt_handler import create_access_token
+from services.notification_service import anniversary_month_day
+from services.couple_context import invalidate_couple_context
+from services.couple_backfill import enqueue_couple_migration
+from services.serialization import FastJSONResponse, from_doc
+import uuid
 from middleware.auth_middleware import get_current_user
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from services.database import get_db
+from pymongo.errors import DuplicateKeyError
 import os
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 
-async def get_db():
-    from server import db
-    return db
-
 @router.post("/register", response_model=UserResponse)
-async def register(user_data: UserRegister):
+async def register(user_data: UserRegister, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Register a new user"""
-    db = await get_db()
-    
     # Check if username already exists
     existing_user = await db.users.find_one({"username": user_data.username})
     if existing_user:
@@ -34,23 +36,31 @@ async def register(user_data: UserRegister):
     # Create user
     user = User(
         username=user_data.username,
-        password_hash=hash_password(user_data.password),
+        password_hash=await hash_password(user_data.password),
         role=user_data.role,
         display_name=user_data.display_name,
         anniversary_date=user_data.anniversary_date,
+        anniversary_md=anniversary_month_day(user_data.anniversary_date),
         relationship_start=user_data.relationship_start
     )
     
-    # Save to database
-    await db.users.insert_one(user.dict())
+    # Save to database (the unique index catches concurrent registrations)
+    user_doc = user.dict()
+    try:
+        await db.users.insert_one(user_doc)
+    except DuplicateKeyError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Username already registered"
+        )
     
-    return UserResponse(**user.dict())
+    await invalidate_couple_context(db, user.id)
+    
+    return FastJSONResponse(from_doc(UserResponse, user_doc))
 
 @router.post("/login", response_model=LoginResponse)
-async def login(credentials: UserLogin):
+async def login(credentials: UserLogin, db: AsyncIOMotorDatabase = Depends(get_db)):
     """Login user and return JWT token"""
-    db = await get_db()
-    
     # Find user
     user_doc = await db.users.find_one({"username": credentials.username})
     if not user_doc:
@@ -60,12 +70,20 @@ async def login(credentials: UserLogin):
         )
     
     # Verify password
-    if not verify_password(credentials.password, user_doc["password_hash"]):
+    valid, new_hash = await verify_and_update_password(credentials.password, user_doc["password_hash"])
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password"
         )
     
+    # Rehash with the current bcrypt cost
+    if new_hash:
+        await db.users.update_one(
+            {"id": user_doc["id"]},
+            {"$set": {"password_hash": new_hash}}
+        )
+    
     # Create access token
     token_data = {
         "sub": user_doc["id"],
@@ -76,36 +94,25 @@ async def login(credentials: UserLogin):
     }
     access_token = create_access_token(data=token_data)
     
-    user_response = UserResponse(**user_doc)
-    
-    return LoginResponse(
+    return FastJSONResponse(LoginResponse.model_construct(
         access_token=access_token,
         token_type="bearer",
-        user=user_response
-    )
+        user=from_doc(UserResponse, user_doc)
+    ))
 
 @router.get("/me", response_model=UserResponse)
 async def get_me(current_user: dict = Depends(get_current_user)):
     """Get current user information"""
-    db = await get_db()
-    
-    user_doc = await db.users.find_one({"id": current_user["id"]})
-    if not user_doc:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="User not found"
-        )
-    
-    return UserResponse(**user_doc)
+    # get_current_user already loaded the user through the couple context cache
+    return FastJSONResponse(from_doc(UserResponse, current_user["context"]["user"]))
 
 @router.post("/link-partner")
 async def link_partner(
     partner_data: LinkPartner,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Link current user with their partner"""
-    db = await get_db()
-    
     # Find partner by username
     partner_doc = await db.users.find_one({"username": partner_data.partner_username})
     if not partner_doc:
@@ -121,15 +128,22 @@ async def link_partner(
             detail="Partner must have a different role (one boyfriend, one girlfriend)"
         )
     
+    # Give the couple a shared couple_id; existing content is restamped in the background
+    couple_id = str(uuid.uuid4())
+    
     # Update both users
     await db.users.update_one(
         {"id": current_user["id"]},
-        {"$set": {"partner_id": partner_doc["id"]}}
+        {"$set": {"partner_id": partner_doc["id"], "couple_id": couple_id, "couple_pending": True}}
     )
     
     await db.users.update_one(
         {"id": partner_doc["id"]},
-        {"$set": {"partner_id": current_user["id"]}}
+        {"$set": {"partner_id": current_user["id"], "couple_id": couple_id, "couple_pending": True}}
     )
     
+    await enqueue_couple_migration(db, [current_user["id"], partner_doc["id"]], couple_id)
+    
+    await invalidate_couple_context(db, current_user["id"], partner_doc["id"])
+    
     return {"message": "Successfully linked with partner", "partner_name": partner_doc["display_name"]}
@@ -0,0 +1,36 @@
+from fastapi import APIRouter, Depends, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from middleware.auth_middleware import get_current_user
+from services.event_hub import event_hub
+import asyncio
+import json
+
+router = APIRouter(prefix="/events", tags=["Events"])
+
+# Comment line sent on idle connections so proxies keep them open
+HEARTBEAT_SECONDS = 25
+
+async def event_stream(request: Request, user_id: str):
+    """Yield Server-Sent Events from the user's hub queue until the client leaves"""
+    queue = event_hub.subscribe(user_id)
+    try:
+        yield "retry: 5000\n\n"
+        while not await request.is_disconnected():
+            try:
+                event = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {event['type']}\ndata: {json.dumps(jsonable_encoder(event))}\n\n"
+    finally:
+        event_hub.unsubscribe(user_id, queue)
+
+@router.get("/stream")
+async def stream_events(request: Request, current_user: dict = Depends(get_current_user)):
+    """Stream changes made by either partner as Server-Sent Events"""
+    return StreamingResponse(
+        event_stream(request, current_user["id"]),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from middleware.auth_middleware import get_current_user
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from services.database import get_db
+from services.export import export_ndjson, export_zip
+from datetime import date
+
+router = APIRouter(prefix="/export", tags=["Export"])
+
+EXPORT_FORMATS = {
+    "ndjson": (export_ndjson, "application/x-ndjson"),
+    "zip": (export_zip, "application/zip"),
+}
+
+@router.get("")
+async def export_history(
+    format: str = Query("ndjson", pattern="^(ndjson|zip)$"),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Download the couple's whole history, as NDJSON or as a zip that includes the photos"""
+    export, media_type = EXPORT_FORMATS[format]
+    filename = f"love-os-export-{date.today().isoformat()}.{format}"
+
+    return StreamingResponse(
+        export(db, current_user),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
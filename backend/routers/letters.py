@@ -1,59 +1,79 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Query
 from models.letter import LetterCreate, Letter, LetterResponse
+from models.pagination import Page
 from middleware.auth_middleware import get_current_user
-from typing import List
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from services.database import get_db, read_collection, READ_SECONDARY_PREFERRED
+from services.pagination import paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from services.event_hub import publish_event
+from services.couple_context import couple_filter
+from services.search import index_letter, unindex
+from services.serialization import FastJSONResponse, from_doc, page_of
+from typing import Optional
 
 router = APIRouter(prefix="/letters", tags=["Letters"])
 
-async def get_db():
-    from server import db
-    return db
+@router.get("", response_model=Page[LetterResponse])
+async def get_letters(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Get a page of letters for the couple"""
+    # A list may lag writes by the bounded staleness, so let a secondary serve it
+    collection = read_collection(db, "letters", READ_SECONDARY_PREFERRED)
 
-@router.get("", response_model=List[LetterResponse])
-async def get_letters(current_user: dict = Depends(get_current_user)):
-    """Get all letters for the couple"""
-    db = await get_db()
-    
-    # Get letters where user is either sender or receiver
-    letters = await db.letters.find({
+    # Get letters where either partner is sender or receiver
+    letters, next_cursor = await paginate(collection, couple_filter(current_user, {
         "$or": [
             {"from_user_id": current_user["id"]},
             {"to_user_id": current_user["id"]},
             {"from_user_id": current_user.get("partner_id", "")},
             {"to_user_id": current_user.get("partner_id", "")}
         ]
-    }).sort("created_at", -1).to_list(1000)
+    }), limit, cursor)
     
-    return [LetterResponse(**letter) for letter in letters]
+    return FastJSONResponse(page_of(LetterResponse, letters, next_cursor))
 
 @router.post("", response_model=LetterResponse)
 async def create_letter(
     letter_data: LetterCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Create a new love letter"""
-    db = await get_db()
-    
     letter = Letter(
         title=letter_data.title,
         content=letter_data.content,
         from_user_id=current_user["id"],
         from_name=current_user["display_name"],
-        to_user_id=letter_data.to_user_id
+        to_user_id=letter_data.to_user_id,
+        couple_id=current_user["couple_id"]
     )
     
-    await db.letters.insert_one(letter.dict())
+    letter_doc = letter.dict()
+    await db.letters.insert_one(letter_doc)
+    await index_letter(db, letter_doc)
     
-    return LetterResponse(**letter.dict())
+    await publish_event(db, current_user, {
+        "type": "letter.created",
+        "id": letter.id,
+        "from_user_id": letter.from_user_id,
+        "to_user_id": letter.to_user_id,
+        "title": letter.title,
+        "created_at": letter.created_at
+    })
+    
+    return FastJSONResponse(from_doc(LetterResponse, letter_doc))
 
 @router.delete("/{letter_id}")
 async def delete_letter(
     letter_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Delete a letter (only the sender can delete)"""
-    db = await get_db()
-    
     # Find the letter
     letter = await db.letters.find_one({"id": letter_id})
     if not letter:
@@ -70,5 +90,6 @@ async def delete_letter(
         )
     
     await db.letters.delete_one({"id": letter_id})
+    await unindex(db, letter_id)
     
     return {"message": "Letter deleted successfully"}
\ No newline at end of file
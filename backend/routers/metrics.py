@@ -0,0 +1,48 @@
+from fastapi import APIRouter, Request
+from fastapi.responses import PlainTextResponse
+from auth.jwt_handler import token_cache
+from services.couple_context import couple_cache
+from services.database import pool_options
+from services.event_hub import event_hub
+from services.metrics import Counter, Gauge, render_metrics
+from services.rate_limit import rate_limiter
+
+router = APIRouter(tags=["Metrics"])
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def process_metrics(request: Request):
+    """Snapshot caches, pool limits, admission control and startup timings as metric families"""
+    hits = Counter("cache_hits_total", "In-process cache hits")
+    misses = Counter("cache_misses_total", "In-process cache misses")
+    size = Gauge("cache_entries", "Entries held by in-process caches")
+    for name, cache in (("token", token_cache), ("couple_context", couple_cache)):
+        stats = cache.stats()
+        hits.inc(stats["hits"], cache=name)
+        misses.inc(stats["misses"], cache=name)
+        size.set(stats["size"], cache=name)
+
+    connections = Gauge("event_stream_connections", "Open Server-Sent Event streams on this worker")
+    connections.set(event_hub.connection_count())
+
+    limits = Gauge("mongo_pool_limit", "Configured MongoDB connection pool limits")
+    for name, value in pool_options().items():
+        limits.set(value, limit=name)
+
+    admitted = Gauge("rate_limit_in_flight", "Admitted requests being handled, by limit group")
+    concurrency = Gauge("rate_limit_concurrency_limit", "Requests each limit group may handle at once")
+    for group, policy in rate_limiter.policies.items():
+        admitted.set(rate_limiter.in_flight[group], group=group)
+        concurrency.set(policy.concurrency, group=group)
+    buckets = Gauge("rate_limit_buckets", "Token buckets tracked for clients on this worker")
+    buckets.set(len(rate_limiter.buckets))
+
+    startup = Gauge("app_startup_seconds", "Time spent in each startup phase of this worker")
+    for phase, seconds in request.app.state.startup_timings.items():
+        startup.set(seconds, phase=phase)
+    return [hits, misses, size, connections, limits, admitted, concurrency, buckets, startup]
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics(request: Request):
+    """Expose this worker's metrics in Prometheus text format"""
+    return PlainTextResponse(render_metrics(process_metrics(request)), media_type=PROMETHEUS_CONTENT_TYPE)
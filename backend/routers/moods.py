@@ -1,72 +1,152 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from models.mood import MoodCreate, Mood, MoodResponse
+from fastapi import APIRouter, HTTPException, status, Depends, Query
+from models.mood import MoodCreate, Mood, MoodResponse, MoodStats
+from models.pagination import Page
 from middleware.auth_middleware import get_current_user
-from typing import List
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from services.database import get_db, read_collection, READ_SECONDARY_PREFERRED
+from services.pagination import paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from services.event_hub import publish_event
+from services.couple_context import couple_filter
+from services.serialization import FastJSONResponse, from_doc, from_docs, page_of
+from services.mood_rollups import record_mood
+from services.mood_stats import compute_mood_stats
+from datetime import datetime, date, timedelta
+from typing import List, Optional
+import os
 
 router = APIRouter(prefix="/moods", tags=["Moods"])
 
-async def get_db():
-    from server import db
-    return db
+# Stats configuration
+MAX_STATS_DAYS = int(os.environ.get("MOOD_STATS_MAX_DAYS", str(10 * 366)))
+
+@router.get("", response_model=Page[MoodResponse])
+async def get_moods(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Get a page of mood history for the couple"""
+    # Mood history may trail recent writes by the staleness bound
+    collection = read_collection(db, "moods", READ_SECONDARY_PREFERRED)
 
-@router.get("", response_model=List[MoodResponse])
-async def get_moods(current_user: dict = Depends(get_current_user)):
-    """Get mood history for the couple"""
-    db = await get_db()
-    
     # Get moods from both partners
-    moods = await db.moods.find({
+    moods, next_cursor = await paginate(collection, couple_filter(current_user, {
         "$or": [
             {"user_id": current_user["id"]},
             {"user_id": current_user.get("partner_id", "")}
         ]
-    }).sort("created_at", -1).to_list(1000)
+    }), limit, cursor)
     
-    return [MoodResponse(**mood) for mood in moods]
+    return FastJSONResponse(page_of(MoodResponse, moods, next_cursor))
 
 @router.get("/latest", response_model=List[MoodResponse])
-async def get_latest_moods(current_user: dict = Depends(get_current_user)):
+async def get_latest_moods(
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
     """Get the latest mood from each partner"""
-    db = await get_db()
+    user_ids = [user_id for user_id in (current_user["id"], current_user.get("partner_id")) if user_id]
     
-    moods = []
+    # share_mood keeps each user's latest mood on their user doc
+    latest = {}
+    missing = []
+    async for user in db.users.find({"id": {"$in": user_ids}}, {"_id": 0, "id": 1, "latest_mood": 1}):
+        if "latest_mood" in user:
+            latest[user["id"]] = user["latest_mood"]
+        else:
+            missing.append(user["id"])
     
-    # Get current user's latest mood
-    user_mood = await db.moods.find_one(
-        {"user_id": current_user["id"]},
-        sort=[("created_at", -1)]
-    )
-    if user_mood:
-        moods.append(MoodResponse(**user_mood))
+    # Users who have not shared a mood since latest_mood was introduced
+    if missing:
+        found = {}
+        async for group in db.moods.aggregate([
+            {"$match": {"user_id": {"$in": missing}}},
+            {"$sort": {"user_id": 1, "created_at": -1}},
+            {"$group": {"_id": "$user_id", "mood": {"$first": "$$ROOT"}}}
+        ]):
+            group["mood"].pop("_id", None)
+            found[group["_id"]] = group["mood"]
+        
+        for user_id in missing:
+            latest[user_id] = found.get(user_id)
+            await db.users.update_one(
+                {"id": user_id, "latest_mood": {"$exists": False}},
+                {"$set": {"latest_mood": latest[user_id]}}
+            )
     
-    # Get partner's latest mood
-    if current_user.get("partner_id"):
-        partner_mood = await db.moods.find_one(
-            {"user_id": current_user["partner_id"]},
-            sort=[("created_at", -1)]
-        )
-        if partner_mood:
-            moods.append(MoodResponse(**partner_mood))
+    return FastJSONResponse(from_docs(MoodResponse, [latest[user_id] for user_id in user_ids if latest.get(user_id)]))
+
+@router.get("/stats", response_model=MoodStats)
+async def get_mood_stats(
+    range_: str = Query("30d", alias="range", pattern=r"^([1-9][0-9]*d|all)$"),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Get mood streaks, distributions and partner alignment over the last N days ('30d') or 'all'"""
+    user_ids = [user_id for user_id in (current_user["id"], current_user.get("partner_id")) if user_id]
+    end = datetime.utcnow().date()
+    query = {"user_id": {"$in": user_ids}}
+    if range_ != "all":
+        days = int(range_[:-1])
+        if days > MAX_STATS_DAYS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Range can be at most {MAX_STATS_DAYS} days"
+            )
+        start = end - timedelta(days=days - 1)
+        query["day"] = {"$gte": start.isoformat()}
     
-    return moods
+    # Stats read the daily rollups, never the raw moods, so long ranges stay cheap
+    collection = read_collection(db, "mood_rollups", READ_SECONDARY_PREFERRED)
+    rollups = await collection.find(
+        query, {"_id": 0, "user_id": 1, "day": 1, "moods": 1, "emojis": 1}
+    ).to_list(None)
+    
+    if range_ == "all":
+        first = min((rollup["day"] for rollup in rollups), default=end.isoformat())
+        start = max(date.fromisoformat(first), end - timedelta(days=MAX_STATS_DAYS - 1))
+    
+    stats = compute_mood_stats(rollups, user_ids, start, end)
+    return FastJSONResponse(from_doc(MoodStats, {"range": range_, **stats}))
 
 @router.post("", response_model=MoodResponse)
 async def share_mood(
     mood_data: MoodCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Share current mood"""
-    db = await get_db()
-    
     mood = Mood(
         user_id=current_user["id"],
         username=current_user["username"],
         role=current_user["role"],
         mood=mood_data.mood,
         emoji=mood_data.emoji,
-        note=mood_data.note
+        note=mood_data.note,
+        couple_id=current_user["couple_id"]
+    )
+    
+    mood_doc = mood.dict()
+    await db.moods.insert_one(mood_doc)
+    await record_mood(db, mood_doc)
+    
+    # Keep the denormalized latest mood, unless a newer one got there first
+    await db.users.update_one(
+        {"id": mood.user_id, "$or": [
+            {"latest_mood": None},
+            {"latest_mood.created_at": {"$lt": mood.created_at}}
+        ]},
+        {"$set": {"latest_mood": {key: value for key, value in mood_doc.items() if key != "_id"}}}
     )
     
-    await db.moods.insert_one(mood.dict())
+    await publish_event(db, current_user, {
+        "type": "mood.shared",
+        "id": mood.id,
+        "user_id": mood.user_id,
+        "mood": mood.mood,
+        "emoji": mood.emoji,
+        "created_at": mood.created_at
+    })
     
-    return MoodResponse(**mood.dict())
\ No newline at end of file
+    return FastJSONResponse(from_doc(MoodResponse, mood_doc))
\ No newline at end of file
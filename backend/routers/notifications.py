@@ -1,36 +1,49 @@
 from fastapi import APIRouter, HTTPException, status, Depends
-from models.notification import NotificationResponse
+from models.notification import NotificationResponse, NotificationsMarkRead
 from middleware.auth_middleware import get_current_user
-from services.notification_service import generate_anniversary_notifications, get_user_notifications
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from services.database import get_db
+from services.notification_service import get_user_notifications, count_unread_notifications, subtract_unread_count
+from services.serialization import FastJSONResponse, from_docs
 from typing import List
 
 router = APIRouter(prefix="/notifications", tags=["Notifications"])
 
-async def get_db():
-    from server import db
-    return db
-
 @router.get("", response_model=List[NotificationResponse])
-async def get_notifications(current_user: dict = Depends(get_current_user)):
+async def get_notifications(
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
     """Get all notifications for current user"""
-    db = await get_db()
-    
-    # Generate new notifications if needed
-    await generate_anniversary_notifications(db)
-    
-    # Get user's notifications
+    # Get user's notifications (anniversaries are generated by a background job)
     notifications = await get_user_notifications(db, current_user["id"])
     
-    return [NotificationResponse(**notif) for notif in notifications]
+    return FastJSONResponse(from_docs(NotificationResponse, notifications))
+
+@router.put("/read")
+async def mark_many_as_read(
+    mark_data: NotificationsMarkRead,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Mark a list of notifications, or all of them, as read"""
+    query = {"user_id": current_user["id"], "read": False}
+    if mark_data.ids != "all":
+        query["id"] = {"$in": mark_data.ids}
+
+    # Ids that aren't the user's unread notifications are skipped rather than rejected
+    result = await db.notifications.update_many(query, {"$set": {"read": True}})
+    await subtract_unread_count(db, current_user["id"], result.modified_count)
+
+    return {"message": "Notifications marked as read", "updated": result.modified_count}
 
 @router.put("/{notification_id}/read")
 async def mark_as_read(
     notification_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Mark a notification as read"""
-    db = await get_db()
-    
     # Find notification
     notification = await db.notifications.find_one({"id": notification_id})
     
@@ -47,22 +60,21 @@ async def mark_as_read(
             detail="This notification doesn't belong to you"
         )
     
-    # Mark as read
-    await db.notifications.update_one(
-        {"id": notification_id},
+    # Mark as read, counting it off only if it was still unread
+    result = await db.notifications.update_one(
+        {"id": notification_id, "read": False},
         {"$set": {"read": True}}
     )
+    await subtract_unread_count(db, current_user["id"], result.modified_count)
     
     return {"message": "Notification marked as read"}
 
 @router.get("/unread/count")
-async def get_unread_count(current_user: dict = Depends(get_current_user)):
+async def get_unread_count(
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
     """Get count of unread notifications"""
-    db = await get_db()
-    
-    count = await db.notifications.count_documents({
-        "user_id": current_user["id"],
-        "read": False
-    })
+    count = await count_unread_notifications(db, current_user["id"])
     
     return {"unread_count": count}
\ No newline at end of file
@@ -1,72 +1,353 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from models.photo import PhotoCreate, Photo, PhotoResponse
+from fastapi import APIRouter, BackgroundTasks, HTTPException, status, Depends, File, Form, Header, Query, UploadFile
+from fastapi.responses import Response, StreamingResponse
+from models.photo import Photo, PhotoResponse
+from models.pagination import Page
 from middleware.auth_middleware import get_current_user
-from typing import List
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from services.database import get_db, read_collection, READ_SECONDARY_PREFERRED
+from services.image_pipeline import process_photo, render_original, run_render
+from services.pagination import paginate, DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from services.event_hub import publish_event
+from services.couple_context import couple_filter
+from services.serialization import FastJSONResponse
+from storage.blob_store import get_blob_store, release_photo_blob, store_photo_blob, StoredBlob, CHUNK_SIZE
+from typing import List, Optional, Tuple
+import base64
+import hashlib
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/photos", tags=["Photos"])
 
-async def get_db():
-    from server import db
-    return db
+PHOTO_VARIANTS = ["original", "medium", "thumbnail"]
+MAX_BATCH_PHOTOS = int(os.environ.get("MAX_BATCH_PHOTOS", "20"))
+
+def photo_response(photo: dict) -> PhotoResponse:
+    """Build a photo response that points at the thumbnail by default"""
+    original_url = f"/api/photos/{photo['id']}/content"
+    derivatives = photo.get("derivatives") or {}
+
+    return PhotoResponse.model_construct(
+        **photo,
+        content_url=f"{original_url}?variant=thumbnail" if "thumbnail" in derivatives else original_url,
+        medium_url=f"{original_url}?variant=medium" if "medium" in derivatives else None,
+        original_url=original_url
+    )
+
+async def read_upload(file: UploadFile):
+    """Yield an uploaded file in fixed-size chunks"""
+    while True:
+        chunk = await file.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+BYTE_RANGE = re.compile(r"(\d*)-(\d*)", re.ASCII)
+
+class RangeNotSatisfiable(Exception):
+    """A valid single byte range that selects nothing of the representation"""
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single "bytes=start-end" range into inclusive offsets
+
+    Returns None for headers to ignore, serving the whole body: other
+    units, malformed ranges and multiple ranges. Raises
+    RangeNotSatisfiable for a valid range starting past the end.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+
+    match = BYTE_RANGE.fullmatch(spec.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    start_str, end_str = match.groups()
+
+    if not start_str:
+        # Suffix range: the last N bytes
+        suffix = int(end_str)
+        if suffix == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(size - suffix, 0), size - 1
+
+    start = int(start_str)
+    end = int(end_str) if end_str else size - 1
+    if end_str and end < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+async def strip_original(db, photo: dict) -> dict:
+    """Re-encode a photo's original without its EXIF, for serving before its derivatives exist"""
+    if photo.get("blob_key"):
+        original = b"".join([chunk async for chunk in get_blob_store(db).stream(photo["blob_key"])])
+    else:
+        original = base64.b64decode(photo["image_base64"].rpartition(",")[2])
+
+    try:
+        return await run_render(original, render_original)
+    except Exception:
+        logger.exception("Error stripping photo %s", photo["id"])
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Photo could not be decoded"
+        )
+
+async def get_couple_photo(db, photo_id: str, current_user: dict) -> dict:
+    """Find a photo and check it belongs to the current couple"""
+    photo = await db.photos.find_one({"id": photo_id})
+    if not photo:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Photo not found"
+        )
+
+    if photo["uploaded_by"] not in [current_user["id"], current_user.get("partner_id", "")]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You can only access photos from your relationship"
+        )
+
+    return photo
+
+@router.get("", response_model=Page[PhotoResponse])
+async def get_photos(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Get a page of photos for the couple"""
+    # Photo lists can come from a secondary
+    collection = read_collection(db, "photos", READ_SECONDARY_PREFERRED)
 
-@router.get("", response_model=List[PhotoResponse])
-async def get_photos(current_user: dict = Depends(get_current_user)):
-    """Get all photos for the couple"""
-    db = await get_db()
-    
     # Get photos uploaded by either partner
-    photos = await db.photos.find({
+    photos, next_cursor = await paginate(collection, couple_filter(current_user, {
         "$or": [
             {"uploaded_by": current_user["id"]},
             {"uploaded_by": current_user.get("partner_id", "")}
         ]
-    }).sort("created_at", -1).to_list(1000)
-    
-    return [PhotoResponse(**photo) for photo in photos]
+    }), limit, cursor, projection={"image_base64": 0})
+
+    return FastJSONResponse(Page[PhotoResponse].model_construct(
+        items=[photo_response(photo) for photo in photos],
+        next_cursor=next_cursor
+    ))
+
+def check_image_upload(file: UploadFile):
+    """Reject uploads that don't declare an image content type"""
+    if not file.content_type or not file.content_type.startswith("image/"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Only image uploads are allowed"
+        )
+
+def new_photo(file: UploadFile, blob: StoredBlob, caption: str, date: str, current_user: dict) -> Photo:
+    """Describe a stored upload as a photo of the user's couple"""
+    return Photo(
+        blob_key=blob.key,
+        content_type=file.content_type,
+        size=blob.size,
+        caption=caption,
+        date=date,
+        uploaded_by=current_user["id"],
+        uploader_name=current_user["display_name"],
+        couple_id=current_user["couple_id"]
+    )
+
+async def announce_photo(db, current_user: dict, photo: Photo):
+    """Tell both partners' clients about a new photo"""
+    await publish_event(db, current_user, {
+        "type": "photo.uploaded",
+        "id": photo.id,
+        "uploaded_by": photo.uploaded_by,
+        "created_at": photo.created_at
+    })
 
 @router.post("", response_model=PhotoResponse)
 async def upload_photo(
-    photo_data: PhotoCreate,
-    current_user: dict = Depends(get_current_user)
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    caption: str = Form(...),
+    date: str = Form(...),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Upload a new photo"""
-    db = await get_db()
-    
-    photo = Photo(
-        image_base64=photo_data.image_base64,
-        caption=photo_data.caption,
-        date=photo_data.date,
-        uploaded_by=current_user["id"],
-        uploader_name=current_user["display_name"]
+    check_image_upload(file)
+
+    # Stream the upload into the blob store
+    blob = await store_photo_blob(db, read_upload(file))
+
+    photo = new_photo(file, blob, caption, date, current_user)
+    photo_doc = photo.dict()
+    try:
+        await db.photos.insert_one(photo_doc)
+    except Exception:
+        await release_photo_blob(db, blob.key)
+        raise
+
+    # Thumbnails are rendered off the event loop once the response is sent
+    background_tasks.add_task(process_photo, db, photo.id, blob.key)
+
+    await announce_photo(db, current_user, photo)
+
+    return FastJSONResponse(photo_response(photo_doc))
+
+@router.post("/batch", response_model=List[PhotoResponse])
+async def upload_photos(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    captions: List[str] = Form([]),
+    date: str = Form(...),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Upload several photos at once; captions pair with files by position"""
+    if len(files) > MAX_BATCH_PHOTOS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_BATCH_PHOTOS} photos can be uploaded at once"
+        )
+    if len(captions) > len(files):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="More captions than photos"
+        )
+    for file in files:
+        check_image_upload(file)
+
+    # Stream each part into the blob store, then record them all in one write
+    photos = []
+    try:
+        for index, file in enumerate(files):
+            blob = await store_photo_blob(db, read_upload(file))
+            caption = captions[index] if index < len(captions) else ""
+            photos.append(new_photo(file, blob, caption, date, current_user))
+
+        photo_docs = [photo.dict() for photo in photos]
+        await db.photos.insert_many(photo_docs)
+    except Exception:
+        # Don't leave blobs behind that no photo points at
+        for photo in photos:
+            await release_photo_blob(db, photo.blob_key)
+        raise
+
+    for photo in photos:
+        background_tasks.add_task(process_photo, db, photo.id, photo.blob_key)
+        await announce_photo(db, current_user, photo)
+
+    return FastJSONResponse([photo_response(photo_doc) for photo_doc in photo_docs])
+
+@router.get("/{photo_id}/content")
+async def get_photo_content(
+    photo_id: str,
+    variant: str = "original",
+    range_header: Optional[str] = Header(None, alias="Range"),
+    if_none_match: Optional[str] = Header(None),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Stream the image bytes of a photo, honouring ETag and Range requests"""
+    if variant not in PHOTO_VARIANTS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Variant must be one of: {', '.join(PHOTO_VARIANTS)}"
+        )
+
+    photo = await get_couple_photo(db, photo_id, current_user)
+
+    blob = (photo.get("derivatives") or {}).get(variant)
+    if blob is not None:
+        etag = f'"{blob["blob_key"]}"'
+        # Blobs are content-addressed, so a cached copy never goes stale
+        cache_control = "private, max-age=31536000, immutable"
+    else:
+        # Until the derivatives are ready, every variant is the original with its
+        # EXIF stripped on the fly; clients refetch once the variant renders
+        if photo.get("blob_key"):
+            source_tag = photo["blob_key"]
+        else:
+            # Photos uploaded before the blob store keep their bytes inline
+            source_tag = hashlib.sha256(photo["image_base64"].encode()).hexdigest()
+        etag = f'"{source_tag}-stripped"'
+        cache_control = "private, no-cache"
+
+    headers = {"ETag": etag, "Accept-Ranges": "bytes", "Cache-Control": cache_control}
+
+    if etag_matches(if_none_match, etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+    data = None
+    if blob is not None:
+        content_type = blob["content_type"]
+        size = blob["size"]
+    else:
+        stripped = await strip_original(db, photo)
+        data = stripped["data"]
+        content_type = stripped["content_type"]
+        size = len(data)
+
+    start, end = 0, size - 1
+    status_code = status.HTTP_200_OK
+    if range_header:
+        try:
+            byte_range = parse_range(range_header, size)
+        except RangeNotSatisfiable:
+            return Response(
+                status_code=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE,
+                headers={**headers, "Content-Range": f"bytes */{size}"}
+            )
+        # Other units, malformed and multiple ranges get the whole body
+        if byte_range is not None:
+            start, end = byte_range
+            status_code = status.HTTP_206_PARTIAL_CONTENT
+            headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+
+    length = end - start + 1
+    headers["Content-Length"] = str(length)
+
+    if data is not None:
+        return Response(
+            content=data[start:end + 1],
+            status_code=status_code,
+            media_type=content_type,
+            headers=headers
+        )
+
+    return StreamingResponse(
+        get_blob_store(db).stream(blob["blob_key"], start=start, length=length),
+        status_code=status_code,
+        media_type=content_type,
+        headers=headers
     )
-    
-    await db.photos.insert_one(photo.dict())
-    
-    return PhotoResponse(**photo.dict())
 
 @router.delete("/{photo_id}")
 async def delete_photo(
     photo_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Delete a photo"""
-    db = await get_db()
-    
-    # Find the photo
-    photo = await db.photos.find_one({"id": photo_id})
-    if not photo:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Photo not found"
-        )
-    
-    # Check if current user uploaded it or is the partner
-    if photo["uploaded_by"] not in [current_user["id"], current_user.get("partner_id", "")]:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="You can only delete photos from your relationship"
-        )
-    
+    # Find the photo and check it belongs to the relationship
+    photo = await get_couple_photo(db, photo_id, current_user)
+
     await db.photos.delete_one({"id": photo_id})
-    
+
+    blob_keys = [photo.get("blob_key")]
+    blob_keys += [derivative["blob_key"] for derivative in (photo.get("derivatives") or {}).values()]
+    for blob_key in filter(None, blob_keys):
+        await release_photo_blob(db, blob_key)
+
     return {"message": "Photo deleted successfully"}
\ No newline at end of file
@@ -1,16 +1,20 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Query
 from models.question import Question, QuestionResponse, AnswerCreate, Answer, AnswerResponse
 from middleware.auth_middleware import get_current_user
-from typing import List
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from services.database import get_db
+from services.event_hub import publish_event
+from services.couple_context import couple_filter
+from services.search import index_answer
+from services.serialization import FastJSONResponse, from_doc, from_docs
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from typing import Dict, List, Optional
 from datetime import datetime, date
 import random
 
 router = APIRouter(prefix="/questions", tags=["Questions"])
 
-async def get_db():
-    from server import db
-    return db
-
 # Predefined questions pool
 QUESTIONS_POOL = [
     {"text": "What's your favorite memory of us together?", "category": "memories"},
@@ -30,42 +34,66 @@ QUESTIONS_POOL = [
     {"text": "What's one thing you want me to know but haven't told me?", "category": "communication"},
 ]
 
+# Most questions one batch answer fetch may ask for
+MAX_ANSWER_BATCH = 100
+
+# Day the question schedule starts counting from
+SCHEDULE_EPOCH = date(2024, 1, 1)
+
+# Today's question, memoized until the date changes
+_daily_question: Optional[QuestionResponse] = None
+
+def scheduled_question(day: date) -> dict:
+    """Pick the question for a day; every question is used once per cycle through the pool"""
+    day_index = (day - SCHEDULE_EPOCH).days
+    cycle, position = divmod(day_index, len(QUESTIONS_POOL))
+
+    # A private RNG keeps the order stable across workers without touching the global one
+    order = list(range(len(QUESTIONS_POOL)))
+    random.Random(f"questions-cycle-{cycle}").shuffle(order)
+
+    return QUESTIONS_POOL[order[position]]
+
 @router.get("/daily", response_model=QuestionResponse)
-async def get_daily_question(current_user: dict = Depends(get_current_user)):
+async def get_daily_question(
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
     """Get today's daily question"""
-    db = await get_db()
-    
+    global _daily_question
+
     today = date.today().isoformat()
-    
-    # Check if there's already a question for today
-    existing_question = await db.questions.find_one({"date": today})
-    
-    if existing_question:
-        return QuestionResponse(**existing_question)
-    
-    # Create a new question for today
-    # Use date as seed for consistent daily question
-    random.seed(today)
-    question_data = random.choice(QUESTIONS_POOL)
-    
+    if _daily_question is not None and _daily_question.date == today:
+        return FastJSONResponse(_daily_question)
+
+    question_data = scheduled_question(date.today())
     question = Question(
         question_text=question_data["text"],
         category=question_data["category"],
         date=today
     )
     
-    await db.questions.insert_one(question.dict())
+    # Keep the first stored question for today; the unique date index settles races
+    try:
+        stored = await db.questions.find_one_and_update(
+            {"date": today},
+            {"$setOnInsert": question.dict()},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        stored = await db.questions.find_one({"date": today})
     
-    return QuestionResponse(**question.dict())
+    _daily_question = from_doc(QuestionResponse, stored)
+    return FastJSONResponse(_daily_question)
 
 @router.post("/answers", response_model=AnswerResponse)
 async def submit_answer(
     answer_data: AnswerCreate,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Submit an answer to a question"""
-    db = await get_db()
-    
     # Check if user already answered this question
     existing_answer = await db.answers.find_one({
         "question_id": answer_data.question_id,
@@ -79,7 +107,14 @@ async def submit_answer(
             {"$set": {"answer_text": answer_data.answer_text}}
         )
         existing_answer["answer_text"] = answer_data.answer_text
-        return AnswerResponse(**existing_answer)
+        await index_answer(db, existing_answer)
+        await publish_event(db, current_user, {
+            "type": "answer.submitted",
+            "id": existing_answer["id"],
+            "question_id": answer_data.question_id,
+            "user_id": current_user["id"]
+        })
+        return FastJSONResponse(from_doc(AnswerResponse, existing_answer))
     
     # Create new answer
     answer = Answer(
@@ -87,27 +122,68 @@ async def submit_answer(
         user_id=current_user["id"],
         username=current_user["username"],
         role=current_user["role"],
-        answer_text=answer_data.answer_text
+        answer_text=answer_data.answer_text,
+        couple_id=current_user["couple_id"]
     )
     
-    await db.answers.insert_one(answer.dict())
+    answer_doc = answer.dict()
+    await db.answers.insert_one(answer_doc)
+    await index_answer(db, answer_doc)
     
-    return AnswerResponse(**answer.dict())
+    await publish_event(db, current_user, {
+        "type": "answer.submitted",
+        "id": answer.id,
+        "question_id": answer.question_id,
+        "user_id": answer.user_id
+    })
+    
+    return FastJSONResponse(from_doc(AnswerResponse, answer_doc))
+
+@router.get("/answers", response_model=Dict[str, List[AnswerResponse]])
+async def get_answers_batch(
+    ids: List[str] = Query(..., description="Question ids, repeated or comma-separated"),
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Get both partners' answers for several questions, keyed by question id"""
+    question_ids = list(dict.fromkeys(
+        question_id for value in ids for question_id in value.split(",") if question_id
+    ))
+    if len(question_ids) > MAX_ANSWER_BATCH:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {MAX_ANSWER_BATCH} questions can be fetched at once"
+        )
+
+    # One query over the (couple_id, question_id) index instead of one per question
+    answers_by_question = {question_id: [] for question_id in question_ids}
+    async for answer in db.answers.find({
+        "question_id": {"$in": question_ids},
+        **couple_filter(current_user, {"$or": [
+            {"user_id": current_user["id"]},
+            {"user_id": current_user.get("partner_id", "")}
+        ]})
+    }):
+        answers_by_question[answer["question_id"]].append(answer)
+
+    return FastJSONResponse({
+        question_id: from_docs(AnswerResponse, answers)
+        for question_id, answers in answers_by_question.items()
+    })
 
 @router.get("/answers/{question_id}", response_model=List[AnswerResponse])
 async def get_answers(
     question_id: str,
-    current_user: dict = Depends(get_current_user)
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
 ):
     """Get answers for a specific question from both partners"""
-    db = await get_db()
-    
     answers = await db.answers.find({
         "question_id": question_id,
-        "$or": [
+        **couple_filter(current_user, {"$or": [
             {"user_id": current_user["id"]},
             {"user_id": current_user.get("partner_id", "")}
-        ]
+        ]})
     }).to_list(10)
     
-    return [AnswerResponse(**answer) for answer in answers]
\ No newline at end of file
+    return FastJSONResponse(from_docs(AnswerResponse, answers))
\ No newline at end of file
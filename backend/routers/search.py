@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends, Query
+from models.pagination import Page
+from models.search import SearchResult
+from middleware.auth_middleware import get_current_user
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from services.database import get_db
+from services.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from services.search import search_couple
+from services.serialization import FastJSONResponse, page_of
+from typing import Optional
+
+router = APIRouter(prefix="/search", tags=["Search"])
+
+@router.get("", response_model=Page[SearchResult])
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    current_user: dict = Depends(get_current_user),
+    db: AsyncIOMotorDatabase = Depends(get_db)
+):
+    """Search the couple's letters and answers, best match first"""
+    # Until its couple_id is backfilled, a couple's content isn't fully indexed under it
+    if not current_user.get("couple_id") or current_user.get("couple_pending"):
+        return FastJSONResponse(page_of(SearchResult, [], None))
+
+    results, next_cursor = await search_couple(db, current_user["couple_id"], q, limit, cursor)
+
+    return FastJSONResponse(page_of(SearchResult, results, next_cursor))
@@ -0,0 +1,47 @@
+"""Fail if any router query would run as a collection scan.
+
+Only explains the queries, leaving the database as it is. Pass
+--create-indexes to create the declared indexes first.
+
+Usage: python scripts/check_query_plans.py [--create-indexes]
+"""
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+from pathlib import Path
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+# Add backend directory to Python path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from services.db_indexes import ensure_indexes, find_collection_scans
+
+ROOT_DIR = Path(__file__).parent.parent
+load_dotenv(ROOT_DIR / '.env')
+
+async def main(create_indexes: bool) -> int:
+    client = AsyncIOMotorClient(os.environ['MONGO_URL'])
+    db = client[os.environ['DB_NAME']]
+    try:
+        if create_indexes:
+            await ensure_indexes(db)
+        offenders = await find_collection_scans(db)
+    finally:
+        client.close()
+
+    if offenders:
+        print("COLLSCAN found in: " + ", ".join(offenders))
+        return 1
+    print("All router queries use an index")
+    return 0
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fail if any router query would run as a collection scan")
+    parser.add_argument("--create-indexes", action="store_true", help="create the declared indexes before explaining")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s - %(message)s')
+    sys.exit(asyncio.run(main(args.create_indexes)))
@@ -1,8 +1,15 @@
-from fastapi import FastAPI, APIRouter
+import time
+
+# Measured from here so the startup breakdown includes import cost
+_IMPORT_STARTED = time.perf_counter()
+
+from fastapi import FastAPI, APIRouter, Depends
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
+from contextlib import asynccontextmanager
+from motor.motor_asyncio import AsyncIOMotorDatabase
 import os
+import asyncio
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
@@ -17,19 +24,32 @@ sys.path.insert(0, str(Path(__file__).parent))
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+from services.serialization import FastJSONResponse, from_docs
+from services.database import create_client, get_db, warm_up
 
-# Create the main app without a prefix
-app = FastAPI(title="Couples App API", version="1.0.0")
+# Import routers
+from routers import auth, letters, photos, moods, questions, notifications, events, export, search, metrics
+from middleware.metrics_middleware import MetricsMiddleware
+from middleware.rate_limit_middleware import RateLimitMiddleware
+from services.image_pipeline import backfill_photo_derivatives, shutdown_image_pipeline
+from services.db_indexes import ensure_indexes
+from services.notification_service import run_notification_job, run_unread_reconciliation
+from services.couple_context import run_invalidation_sync
+from services.couple_backfill import run_couple_backfill
+from services.event_hub import run_change_stream_bridge, EVENT_BRIDGE
+from services.search import backfill_search_index
+from services.rate_limit import RATE_LIMIT_ENABLED
+from services.mood_rollups import run_mood_rollup_job
+from storage.blob_store import run_blob_sweep
 
-# Create a router with the /api prefix
-api_router = APIRouter(prefix="/api")
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
 
-# Import routers
-from routers import auth, letters, photos, moods, questions, notifications
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
 
 # Define Models
 class StatusCheck(BaseModel):
@@ -40,22 +60,25 @@ class StatusCheck(BaseModel):
 class StatusCheckCreate(BaseModel):
     client_name: str
 
+# Create a router with the /api prefix
+api_router = APIRouter(prefix="/api")
+
 # Add your routes to the router instead of directly to app
 @api_router.get("/")
 async def root():
     return {"message": "Couples App API - Love OS 💕"}
 
 @api_router.post("/status", response_model=StatusCheck)
-async def create_status_check(input: StatusCheckCreate):
+async def create_status_check(input: StatusCheckCreate, db: AsyncIOMotorDatabase = Depends(get_db)):
     status_dict = input.dict()
     status_obj = StatusCheck(**status_dict)
     _ = await db.status_checks.insert_one(status_obj.dict())
-    return status_obj
+    return FastJSONResponse(status_obj)
 
 @api_router.get("/status", response_model=List[StatusCheck])
-async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
-    return [StatusCheck(**status_check) for status_check in status_checks]
+async def get_status_checks(db: AsyncIOMotorDatabase = Depends(get_db)):
+    status_checks = await db.status_checks.find({}, {"_id": 0}).to_list(1000)
+    return FastJSONResponse(from_docs(StatusCheck, status_checks))
 
 # Include feature routers
 api_router.include_router(auth.router)
@@ -64,25 +87,104 @@ api_router.include_router(photos.router)
 api_router.include_router(moods.router)
 api_router.include_router(questions.router)
 api_router.include_router(notifications.router)
-
-# Include the router in the main app
-app.include_router(api_router)
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_credentials=True,
-    allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
-logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
+api_router.include_router(events.router)
+api_router.include_router(export.router)
+api_router.include_router(search.router)
+
+async def backfill_search(db: AsyncIOMotorDatabase):
+    """Index content written before search existed, off the startup path"""
+    try:
+        await backfill_search_index(db)
+    except Exception:
+        logger.exception("Error indexing existing content for search")
+
+async def backfill_photos(db: AsyncIOMotorDatabase):
+    """Render derivatives for photos uploaded before them, off the startup path"""
+    try:
+        await backfill_photo_derivatives(db)
+    except Exception:
+        logger.exception("Error rendering derivatives for existing photos")
+
+def start_background_jobs(db: AsyncIOMotorDatabase) -> List[asyncio.Task]:
+    tasks = [
+        asyncio.create_task(backfill_search(db)),
+        asyncio.create_task(backfill_photos(db)),
+        asyncio.create_task(run_notification_job(db)),
+        asyncio.create_task(run_unread_reconciliation(db)),
+        asyncio.create_task(run_invalidation_sync(db)),
+        asyncio.create_task(run_couple_backfill(db)),
+        asyncio.create_task(run_mood_rollup_job(db)),
+        asyncio.create_task(run_blob_sweep(db)),
+    ]
+    if EVENT_BRIDGE == "changestream":
+        tasks.append(asyncio.create_task(run_change_stream_bridge(db)))
+    return tasks
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the database for the app's lifetime and run the background jobs"""
+    timings = app.state.startup_timings
+    started = time.perf_counter()
+    client = create_client()
+    await warm_up(client)
+    app.state.db = client[os.environ['DB_NAME']]
+    timings["connect"] = time.perf_counter() - started
+
+    # Before serving: unique indexes back the upserts that keep data free of duplicates
+    started = time.perf_counter()
+    await ensure_indexes(app.state.db)
+    timings["indexes"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    tasks = start_background_jobs(app.state.db)
+    timings["background_jobs"] = time.perf_counter() - started
+
+    logger.info("Startup finished in %.0f ms (%s)", sum(timings.values()) * 1000, ", ".join(
+        f"{phase} {seconds * 1000:.0f} ms" for phase, seconds in timings.items()
+    ))
+    try:
+        yield
+    finally:
+        for task in tasks:
+            task.cancel()
+        # Let cancelled jobs unwind out of any write before the client closes
+        await asyncio.gather(*tasks, return_exceptions=True)
+        shutdown_image_pipeline()
+        client.close()
+
+def create_app() -> FastAPI:
+    """Build the API application; the database is opened by its lifespan"""
+    started = time.perf_counter()
+    app = FastAPI(
+        title="Couples App API",
+        version="1.0.0",
+        default_response_class=FastJSONResponse,
+        lifespan=lifespan
+    )
+
+    # Include the router in the main app
+    app.include_router(api_router)
+    app.include_router(metrics.router)
+
+    # Inside CORS, so rejections still carry the CORS headers browsers need to read them
+    if RATE_LIMIT_ENABLED:
+        app.add_middleware(RateLimitMiddleware)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_credentials=True,
+        allow_origins=os.environ.get('CORS_ORIGINS', '*').split(','),
+        allow_methods=["*"],
+        allow_headers=["*"],
+    )
+
+    # Outermost, so latency covers CORS and every other middleware
+    app.add_middleware(MetricsMiddleware)
+
+    app.state.startup_timings = {
+        "imports": IMPORT_SECONDS,
+        "create_app": time.perf_counter() - started,
+    }
+    return app
+
+app = create_app()
@@ -0,0 +1,148 @@
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from services.couple_context import invalidate_couple_context
+from services.pagination import paginate
+from services.search import SEARCH_SOURCES, index_documents
+from typing import List
+import asyncio
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Backfill configuration
+COUPLE_BACKFILL_BATCH_SIZE = int(os.environ.get("COUPLE_BACKFILL_BATCH_SIZE", "500"))
+COUPLE_BACKFILL_INTERVAL = float(os.environ.get("COUPLE_BACKFILL_INTERVAL_SECONDS", "5"))
+MIGRATION_LEASE = timedelta(minutes=2)
+# Catch-up window for documents written by workers with a stale couple_id
+CATCH_UP_WINDOW = timedelta(minutes=5)
+
+# Couple-scoped collections and the fields naming the users who own each document
+COUPLE_SCOPED_COLLECTIONS = {
+    "letters": ["from_user_id", "to_user_id"],
+    "moods": ["user_id"],
+    "photos": ["uploaded_by"],
+    "answers": ["user_id"],
+    "search_entries": ["user_ids"],
+}
+
+def owner_filter(owner_fields: List[str], user_ids: List[str]) -> dict:
+    """Match documents owned by any of these users"""
+    clauses = [{field: {"$in": user_ids}} for field in owner_fields]
+    return clauses[0] if len(clauses) == 1 else {"$or": clauses}
+
+async def enqueue_couple_migration(db: AsyncIOMotorDatabase, user_ids: List[str], couple_id: str):
+    """Queue restamping of these users' content and mark them pending until it is done"""
+    await db.couple_migrations.update_one(
+        {"couple_id": couple_id},
+        {"$setOnInsert": {
+            "couple_id": couple_id,
+            "user_ids": user_ids,
+            "progress": {},
+            "done": False,
+            "lease_until": None,
+            "created_at": datetime.utcnow()
+        }},
+        upsert=True
+    )
+
+async def assign_legacy_couple_ids(db: AsyncIOMotorDatabase):
+    """Give users created before couple_id existed one, shared with their partner"""
+    async for user in db.users.find(
+        {"couple_id": {"$exists": False}},
+        {"_id": 0, "id": 1, "partner_id": 1}
+    ).batch_size(COUPLE_BACKFILL_BATCH_SIZE):
+        user_ids = [user["id"]]
+        couple_id = str(uuid.uuid4())
+
+        if user.get("partner_id"):
+            partner = await db.users.find_one({"id": user["partner_id"]}, {"_id": 0, "couple_id": 1})
+            if partner and partner.get("couple_id"):
+                couple_id = partner["couple_id"]
+            user_ids.append(user["partner_id"])
+
+        await enqueue_couple_migration(db, user_ids, couple_id)
+        await db.users.update_many(
+            {"id": {"$in": user_ids}, "couple_id": {"$exists": False}},
+            {"$set": {"couple_id": couple_id, "couple_pending": True}}
+        )
+
+async def run_couple_migration(db: AsyncIOMotorDatabase, migration: dict):
+    """Stamp every document owned by the migration's users with its couple_id, batch by batch"""
+    couple_id = migration["couple_id"]
+    user_ids = migration["user_ids"]
+
+    for collection, owner_fields in COUPLE_SCOPED_COLLECTIONS.items():
+        query = owner_filter(owner_fields, user_ids)
+        cursor = migration["progress"].get(collection)
+        if cursor == "done":
+            continue
+
+        # Walk the (owner, created_at, id) indexes newest first, saving progress after each batch
+        while True:
+            docs, cursor = await paginate(
+                db[collection], query, COUPLE_BACKFILL_BATCH_SIZE, cursor,
+                projection={"_id": 0, "id": 1, "created_at": 1}
+            )
+            if docs:
+                ids = [doc["id"] for doc in docs]
+                await db[collection].update_many({"id": {"$in": ids}}, {"$set": {"couple_id": couple_id}})
+                if collection in SEARCH_SOURCES:
+                    # Content that had no couple_id was never indexed for search
+                    await index_documents(db, collection, ids)
+            await db.couple_migrations.update_one(
+                {"_id": migration["_id"]},
+                {"$set": {
+                    f"progress.{collection}": cursor or "done",
+                    "lease_until": datetime.utcnow() + MIGRATION_LEASE
+                }}
+            )
+            if cursor is None:
+                break
+
+        # Pick up anything written meanwhile under an old couple_id
+        await db[collection].update_many(
+            {"$and": [
+                query,
+                {"created_at": {"$gte": migration["created_at"] - CATCH_UP_WINDOW}},
+                {"couple_id": {"$ne": couple_id}}
+            ]},
+            {"$set": {"couple_id": couple_id}}
+        )
+
+    await db.couple_migrations.update_one({"_id": migration["_id"]}, {"$set": {"done": True}})
+    await db.users.update_many(
+        {"id": {"$in": user_ids}, "couple_id": couple_id},
+        {"$unset": {"couple_pending": ""}}
+    )
+    await invalidate_couple_context(db, *user_ids)
+    logger.info("Backfilled couple_id %s for users %s", couple_id, ", ".join(user_ids))
+
+async def claim_couple_migration(db: AsyncIOMotorDatabase):
+    """Lease the next pending migration so only one worker runs it"""
+    now = datetime.utcnow()
+    return await db.couple_migrations.find_one_and_update(
+        {"done": False, "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]},
+        {"$set": {"lease_until": now + MIGRATION_LEASE}},
+        sort=[("created_at", 1)],
+        return_document=ReturnDocument.AFTER
+    )
+
+async def run_couple_backfill(db: AsyncIOMotorDatabase, interval: float = COUPLE_BACKFILL_INTERVAL):
+    """Assign couple ids to legacy users, then keep draining queued migrations"""
+    try:
+        await assign_legacy_couple_ids(db)
+    except Exception:
+        logger.exception("Error assigning legacy couple ids")
+
+    while True:
+        try:
+            migration = await claim_couple_migration(db)
+            while migration is not None:
+                await run_couple_migration(db, migration)
+                migration = await claim_couple_migration(db)
+        except Exception:
+            logger.exception("Error running couple_id backfill")
+        await asyncio.sleep(interval)
@@ -0,0 +1,113 @@
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import Optional
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Couple context cache configuration
+COUPLE_CACHE_TTL = float(os.environ.get("COUPLE_CACHE_TTL_SECONDS", "60"))
+COUPLE_CACHE_SIZE = int(os.environ.get("COUPLE_CACHE_SIZE", "10000"))
+COUPLE_CACHE_SYNC_INTERVAL = float(os.environ.get("COUPLE_CACHE_SYNC_INTERVAL_SECONDS", "2"))
+# Allowance for clock skew between workers when reading the invalidation log
+INVALIDATION_SKEW = timedelta(seconds=5)
+
+class CoupleContextCache:
+    """Bounded TTL cache from user id to the user's couple context"""
+
+    def __init__(self, max_size: int = COUPLE_CACHE_SIZE, ttl: float = COUPLE_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, user_id: str) -> Optional[dict]:
+        """Get a cached context that has not outlived its TTL"""
+        entry = self._entries.get(user_id)
+        if entry is None or entry[0] <= time.monotonic():
+            self._entries.pop(user_id, None)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, user_id: str, context: dict):
+        """Cache a context, evicting the least recently used"""
+        if self.max_size <= 0:
+            return
+        self._entries[user_id] = (time.monotonic() + self.ttl, context)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, *user_ids: str):
+        """Drop the cached contexts of these users"""
+        for user_id in user_ids:
+            self._entries.pop(user_id, None)
+
+    def stats(self) -> dict:
+        """Get hit/miss counters and the current size"""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries)}
+
+couple_cache = CoupleContextCache()
+
+async def get_couple_context(db: AsyncIOMotorDatabase, user_id: str) -> Optional[dict]:
+    """Get a user's doc, partner id and partner name, reading through the cache"""
+    context = couple_cache.get(user_id)
+    if context is not None:
+        return context
+
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "password_hash": 0})
+    if not user:
+        return None
+
+    partner_name = None
+    if user.get("partner_id"):
+        partner = await db.users.find_one({"id": user["partner_id"]}, {"_id": 0, "display_name": 1})
+        partner_name = partner["display_name"] if partner else None
+
+    context = {
+        "user": user,
+        "partner_id": user.get("partner_id"),
+        "partner_name": partner_name,
+    }
+    couple_cache.put(user_id, context)
+    return context
+
+def couple_filter(current_user: dict, legacy_filter: dict) -> dict:
+    """Scope a query to the user's couple, using the legacy per-user filter until backfilled"""
+    if current_user.get("couple_id") and not current_user.get("couple_pending"):
+        return {"couple_id": current_user["couple_id"]}
+    return legacy_filter
+
+async def invalidate_couple_context(db: AsyncIOMotorDatabase, *user_ids: str):
+    """Drop cached contexts here and tell the other workers to do the same"""
+    couple_cache.invalidate(*user_ids)
+    await db.cache_invalidations.insert_one({
+        "user_ids": list(user_ids),
+        "created_at": datetime.utcnow()
+    })
+
+async def run_invalidation_sync(db: AsyncIOMotorDatabase, interval: float = COUPLE_CACHE_SYNC_INTERVAL):
+    """Apply invalidations logged by other workers"""
+    since = datetime.utcnow()
+    while True:
+        await asyncio.sleep(interval)
+        polled_at = datetime.utcnow()
+        try:
+            # Overlapping windows re-apply some invalidations, which is harmless
+            async for doc in db.cache_invalidations.find(
+                {"created_at": {"$gte": since - INVALIDATION_SKEW}},
+                {"_id": 0, "user_ids": 1}
+            ):
+                couple_cache.invalidate(*doc["user_ids"])
+            since = polled_at
+        except Exception:
+            logger.exception("Error syncing couple context invalidations")
@@ -0,0 +1,89 @@
+from fastapi import Request
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection, AsyncIOMotorDatabase
+from pymongo.read_preferences import Primary, SecondaryPreferred
+from services.metrics import command_metrics, pool_metrics
+import importlib.util
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Connection pool configuration
+MONGO_MAX_POOL_SIZE = int(os.environ.get("MONGO_MAX_POOL_SIZE", "100"))
+MONGO_MIN_POOL_SIZE = int(os.environ.get("MONGO_MIN_POOL_SIZE", "0"))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get("MONGO_WAIT_QUEUE_TIMEOUT_MS", "5000"))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.environ.get("MONGO_SERVER_SELECTION_TIMEOUT_MS", "10000"))
+# Wire compression, in order of preference; ones without their library installed are skipped
+MONGO_COMPRESSORS = os.environ.get("MONGO_COMPRESSORS", "zstd,snappy,zlib")
+MONGO_ZLIB_LEVEL = int(os.environ.get("MONGO_ZLIB_LEVEL", "6"))
+# Read routing. Off by default: a list read from a secondary can miss the
+# user's own write for up to the staleness bound, which the server won't set below 90 seconds
+MONGO_SECONDARY_READS = os.environ.get("MONGO_SECONDARY_READS", "false").lower() == "true"
+MONGO_MAX_STALENESS_SECONDS = int(os.environ.get("MONGO_MAX_STALENESS_SECONDS", "90"))
+
+READ_PRIMARY = "primary"
+READ_SECONDARY_PREFERRED = "secondaryPreferred"
+
+# Python modules each compressor needs
+COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy", "zlib": "zlib"}
+
+def available_compressors(names: str = MONGO_COMPRESSORS) -> list:
+    """Keep the configured compressors whose library is installed"""
+    compressors = []
+    for name in filter(None, (part.strip() for part in names.split(","))):
+        module = COMPRESSOR_MODULES.get(name)
+        if module and importlib.util.find_spec(module):
+            compressors.append(name)
+        else:
+            logger.info("MongoDB %s compression is unavailable; skipping it", name)
+    return compressors
+
+def client_options() -> dict:
+    """Build the Motor client options from the environment"""
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "event_listeners": [command_metrics, pool_metrics],
+    }
+    compressors = available_compressors()
+    if compressors:
+        options["compressors"] = ",".join(compressors)
+        if "zlib" in compressors:
+            options["zlibCompressionLevel"] = MONGO_ZLIB_LEVEL
+    return options
+
+def create_client() -> AsyncIOMotorClient:
+    """Create the Motor client; connections are opened lazily on first use"""
+    return AsyncIOMotorClient(os.environ["MONGO_URL"], **client_options())
+
+async def warm_up(client: AsyncIOMotorClient):
+    """Open a pooled connection now rather than on the first request"""
+    await client.admin.command("ping")
+
+def read_preference(mode: str):
+    """Map a read routing mode to a pymongo read preference"""
+    if mode == READ_SECONDARY_PREFERRED and MONGO_SECONDARY_READS:
+        return SecondaryPreferred(max_staleness=MONGO_MAX_STALENESS_SECONDS)
+    return Primary()
+
+def read_collection(db: AsyncIOMotorDatabase, name: str, mode: str = READ_PRIMARY) -> AsyncIOMotorCollection:
+    """Get a collection whose reads are routed by mode
+
+    Use READ_SECONDARY_PREFERRED only for reads that tolerate data up to
+    MONGO_MAX_STALENESS_SECONDS old; a standalone server ignores it.
+    """
+    return db.get_collection(name, read_preference=read_preference(mode))
+
+def pool_options() -> dict:
+    """The configured pool limits, for reading alongside the pool metrics"""
+    return {
+        "max_pool_size": MONGO_MAX_POOL_SIZE,
+        "min_pool_size": MONGO_MIN_POOL_SIZE,
+        "wait_queue_timeout_ms": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+    }
+
+async def get_db(request: Request) -> AsyncIOMotorDatabase:
+    """Get the database opened by the app's lifespan"""
+    return request.app.state.db
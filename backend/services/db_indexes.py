@@ -0,0 +1,214 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, DESCENDING, TEXT, IndexModel
+from pymongo.errors import OperationFailure
+from datetime import datetime
+from typing import Dict, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Indexes backing every query issued from routers/ and services/
+INDEXES: Dict[str, List[IndexModel]] = {
+    "users": [
+        IndexModel([("username", ASCENDING)], unique=True),
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("anniversary_date", ASCENDING)]),
+        IndexModel([("anniversary_md", ASCENDING)], sparse=True),
+    ],
+    "letters": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("from_user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("to_user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("couple_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "moods": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("couple_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("created_at", ASCENDING)]),
+    ],
+    "mood_rollups": [
+        IndexModel([("user_id", ASCENDING), ("day", ASCENDING)], unique=True),
+    ],
+    "photos": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("uploaded_by", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("couple_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+        IndexModel([("blob_key", ASCENDING)]),
+        IndexModel([("derivatives.original.blob_key", ASCENDING)], sparse=True),
+        IndexModel([("derivatives.thumbnail.blob_key", ASCENDING)], sparse=True),
+        IndexModel([("derivatives.medium.blob_key", ASCENDING)], sparse=True),
+    ],
+    "blobs": [
+        IndexModel([("released_at", ASCENDING)], sparse=True),
+    ],
+    "questions": [
+        IndexModel([("date", ASCENDING)], unique=True),
+    ],
+    "answers": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("question_id", ASCENDING), ("user_id", ASCENDING)]),
+        IndexModel([("couple_id", ASCENDING), ("question_id", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "notifications": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        IndexModel([("user_id", ASCENDING), ("read", ASCENDING)]),
+        IndexModel([("user_id", ASCENDING), ("created_at", DESCENDING)]),
+        IndexModel(
+            [("user_id", ASCENDING), ("dedup_key", ASCENDING)],
+            unique=True,
+            partialFilterExpression={"dedup_key": {"$type": "string"}}
+        ),
+        # Only unread notifications, for recounting the unread counters
+        IndexModel(
+            [("user_id", ASCENDING)],
+            name="user_id_unread",
+            partialFilterExpression={"read": False}
+        ),
+    ],
+    "notification_counters": [
+        IndexModel([("user_id", ASCENDING)], unique=True),
+    ],
+    "search_entries": [
+        IndexModel([("id", ASCENDING)], unique=True),
+        # Equality on couple_id first, so a search only reads that couple's postings
+        IndexModel(
+            [("couple_id", ASCENDING), ("title", TEXT), ("text", TEXT)],
+            weights={"title": 3, "text": 1},
+            name="couple_id_text"
+        ),
+        IndexModel([("user_ids", ASCENDING), ("created_at", DESCENDING), ("id", DESCENDING)]),
+    ],
+    "cache_invalidations": [
+        IndexModel([("created_at", ASCENDING)], expireAfterSeconds=60 * 60),
+    ],
+    "couple_migrations": [
+        IndexModel([("couple_id", ASCENDING)], unique=True),
+        IndexModel([("done", ASCENDING), ("created_at", ASCENDING)]),
+    ],
+    "events": [
+        IndexModel([("created_at", ASCENDING)], expireAfterSeconds=5 * 60),
+    ],
+}
+
+# Duplicate data blocking a unique index, or a declared index clashing with an existing one
+FATAL_INDEX_ERRORS = {11000, 85, 86}
+
+async def ensure_indexes(db: AsyncIOMotorDatabase):
+    """Create all declared indexes; existing indexes are left untouched
+
+    Fails when a unique index can't be built or a declared index clashes
+    with an existing one: the upserts that keep data free of duplicates
+    rely on them.
+    """
+    for collection, indexes in INDEXES.items():
+        try:
+            names = await db[collection].create_indexes(indexes)
+            logger.info("Ensured indexes on %s: %s", collection, ", ".join(names))
+        except OperationFailure as e:
+            logger.error("Could not create indexes on %s: %s", collection, e)
+            if e.code in FATAL_INDEX_ERRORS or any(index.document.get("unique") for index in indexes):
+                raise
+
+SAMPLE_ID = "query-plan-sample"
+SAMPLE_DATE = datetime(2024, 1, 1)
+
+# Representative shape of every router/service query, for plan verification.
+# Names are "<module>.<function>"; tests check every router function querying the db has one.
+ROUTER_QUERIES = [
+    {"name": "auth.register", "find": "users", "filter": {"username": SAMPLE_ID}},
+    {"name": "auth.login", "find": "users", "filter": {"username": SAMPLE_ID}},
+    {"name": "auth.link_partner", "find": "users", "filter": {"username": SAMPLE_ID}},
+    {"name": "auth.link_partner (update)", "find": "users", "filter": {"id": SAMPLE_ID}},
+    {"name": "couple_context.get_couple_context", "find": "users", "filter": {"id": SAMPLE_ID}},
+    {"name": "couple_context.run_invalidation_sync", "find": "cache_invalidations", "filter": {"created_at": {"$gte": SAMPLE_DATE}}},
+    {"name": "letters.get_letters", "find": "letters", "filter": {"$or": [
+        {"from_user_id": SAMPLE_ID}, {"to_user_id": SAMPLE_ID},
+        {"from_user_id": SAMPLE_ID}, {"to_user_id": SAMPLE_ID},
+    ]}, "sort": {"created_at": -1, "id": -1}},
+    {"name": "letters.get_letters (cursor)", "find": "letters", "filter": {"$and": [
+        {"$or": [{"from_user_id": SAMPLE_ID}, {"to_user_id": SAMPLE_ID}]},
+        {"$or": [{"created_at": {"$lt": SAMPLE_DATE}}, {"created_at": SAMPLE_DATE, "id": {"$lt": SAMPLE_ID}}]},
+    ]}, "sort": {"created_at": -1, "id": -1}},
+    {"name": "letters.get_letters (couple)", "find": "letters", "filter": {"couple_id": SAMPLE_ID}, "sort": {"created_at": -1, "id": -1}},
+    {"name": "letters.delete_letter", "find": "letters", "filter": {"id": SAMPLE_ID}},
+    {"name": "moods.get_moods", "find": "moods", "filter": {"$or": [
+        {"user_id": SAMPLE_ID}, {"user_id": SAMPLE_ID},
+    ]}, "sort": {"created_at": -1, "id": -1}},
+    {"name": "moods.get_moods (couple)", "find": "moods", "filter": {"couple_id": SAMPLE_ID}, "sort": {"created_at": -1, "id": -1}},
+    {"name": "moods.get_latest_moods", "find": "users", "filter": {"id": {"$in": [SAMPLE_ID, SAMPLE_ID]}}},
+    {"name": "moods.get_latest_moods (fallback)", "find": "moods", "filter": {"user_id": {"$in": [SAMPLE_ID, SAMPLE_ID]}}, "sort": {"user_id": 1, "created_at": -1}},
+    {"name": "moods.share_mood", "find": "users", "filter": {"id": SAMPLE_ID, "$or": [
+        {"latest_mood": None}, {"latest_mood.created_at": {"$lt": SAMPLE_DATE}},
+    ]}},
+    {"name": "moods.get_mood_stats", "find": "mood_rollups", "filter": {
+        "user_id": {"$in": [SAMPLE_ID, SAMPLE_ID]}, "day": {"$gte": "2024-01-01"},
+    }},
+    {"name": "mood_rollups.rebuild_mood_rollups", "find": "moods", "filter": {"created_at": {"$gte": SAMPLE_DATE, "$lt": SAMPLE_DATE}}, "sort": {"created_at": 1}},
+    {"name": "photos.get_photos", "find": "photos", "filter": {"$or": [
+        {"uploaded_by": SAMPLE_ID}, {"uploaded_by": SAMPLE_ID},
+    ]}, "sort": {"created_at": -1, "id": -1}},
+    {"name": "photos.get_photos (couple)", "find": "photos", "filter": {"couple_id": SAMPLE_ID}, "sort": {"created_at": -1, "id": -1}},
+    {"name": "photos.get_couple_photo", "find": "photos", "filter": {"id": SAMPLE_ID}},
+    {"name": "photos.delete_photo", "find": "photos", "filter": {"id": SAMPLE_ID}},
+    {"name": "blob_store.sweep_released_blobs", "find": "blobs", "filter": {"refs": {"$lte": 0}, "released_at": {"$lt": SAMPLE_DATE}}},
+    {"name": "blob_store.sweep_released_blobs (in use)", "find": "photos", "filter": {"$or": [
+        {"blob_key": SAMPLE_ID},
+        {"derivatives.original.blob_key": SAMPLE_ID},
+        {"derivatives.medium.blob_key": SAMPLE_ID},
+        {"derivatives.thumbnail.blob_key": SAMPLE_ID},
+    ]}},
+    {"name": "questions.get_daily_question", "find": "questions", "filter": {"date": "2024-01-01"}},
+    {"name": "questions.submit_answer", "find": "answers", "filter": {"question_id": SAMPLE_ID, "user_id": SAMPLE_ID}},
+    {"name": "questions.get_answers", "find": "answers", "filter": {"question_id": SAMPLE_ID, "$or": [
+        {"user_id": SAMPLE_ID}, {"user_id": SAMPLE_ID},
+    ]}},
+    {"name": "questions.get_answers (couple)", "find": "answers", "filter": {"question_id": SAMPLE_ID, "couple_id": SAMPLE_ID}},
+    {"name": "questions.get_answers_batch (couple)", "find": "answers", "filter": {
+        "question_id": {"$in": [SAMPLE_ID, SAMPLE_ID]}, "couple_id": SAMPLE_ID,
+    }},
+    {"name": "couple_backfill.run_couple_migration", "find": "answers", "filter": {"user_id": {"$in": [SAMPLE_ID, SAMPLE_ID]}}, "sort": {"created_at": -1, "id": -1}},
+    {"name": "couple_backfill.claim_couple_migration", "find": "couple_migrations", "filter": {"done": False, "$or": [
+        {"lease_until": None}, {"lease_until": {"$lt": SAMPLE_DATE}},
+    ]}, "sort": {"created_at": 1}},
+    {"name": "search.search_couple", "find": "search_entries", "filter": {
+        "couple_id": SAMPLE_ID, "$text": {"$search": "paris"},
+    }, "projection": {"score": {"$meta": "textScore"}}, "sort": {"score": {"$meta": "textScore"}, "created_at": -1}},
+    {"name": "search.unindex", "find": "search_entries", "filter": {"id": SAMPLE_ID}},
+    {"name": "couple_backfill.run_couple_migration", "find": "search_entries", "filter": {"user_ids": {"$in": [SAMPLE_ID, SAMPLE_ID]}}, "sort": {"created_at": -1, "id": -1}},
+    {"name": "notifications.get_user_notifications", "find": "notifications", "filter": {"user_id": SAMPLE_ID}, "sort": {"created_at": -1}},
+    {"name": "notifications.mark_as_read", "find": "notifications", "filter": {"id": SAMPLE_ID}},
+    {"name": "notifications.mark_many_as_read", "find": "notifications", "filter": {
+        "user_id": SAMPLE_ID, "read": False, "id": {"$in": [SAMPLE_ID, SAMPLE_ID]},
+    }},
+    {"name": "notifications.get_unread_count", "find": "notification_counters", "filter": {"user_id": SAMPLE_ID}},
+    {"name": "notifications.get_unread_count (uncounted)", "count": "notifications", "query": {"user_id": SAMPLE_ID, "read": False}},
+    {"name": "notification_service.reconcile_unread_counts", "find": "notifications", "filter": {"read": False}, "sort": {"user_id": 1}},
+    {"name": "notification_service.generate", "find": "users", "filter": {"anniversary_md": {"$in": ["01-01", "01-02", "01-08"]}}},
+    {"name": "notification_service.upsert", "find": "notifications", "filter": {
+        "user_id": SAMPLE_ID, "dedup_key": "anniversary:2024-01-01:0",
+    }},
+]
+
+def plan_stages(plan: dict) -> List[str]:
+    """List every stage in an explain plan tree"""
+    stages = [plan["stage"]] if "stage" in plan else []
+    for key in ("inputStage", "queryPlan"):
+        if key in plan:
+            stages += plan_stages(plan[key])
+    for child in plan.get("inputStages", []):
+        stages += plan_stages(child)
+    return stages
+
+async def find_collection_scans(db: AsyncIOMotorDatabase) -> List[str]:
+    """Explain every router query and return the names of those that scan a whole collection"""
+    offenders = []
+    for query in ROUTER_QUERIES:
+        command = {key: value for key, value in query.items() if key != "name"}
+        explain = await db.command({"explain": command, "verbosity": "queryPlanner"})
+        stages = plan_stages(explain["queryPlanner"]["winningPlan"])
+        logger.info("%s: %s", query["name"], " <- ".join(stages))
+        if "COLLSCAN" in stages:
+            offenders.append(query["name"])
+    return offenders
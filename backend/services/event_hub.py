@@ -0,0 +1,90 @@
+from collections import defaultdict
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from typing import Dict, Iterable, Optional, Set
+import asyncio
+import logging
+import os
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Event hub configuration
+EVENT_QUEUE_SIZE = int(os.environ.get("EVENT_QUEUE_SIZE", "100"))
+# "changestream" fans events out to other workers through Mongo (needs a replica set)
+EVENT_BRIDGE = os.environ.get("EVENT_BRIDGE", "")
+
+WORKER_ID = str(uuid.uuid4())
+
+class EventHub:
+    """In-process pub/sub of small change events, one channel per user"""
+
+    def __init__(self, queue_size: int = EVENT_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers: Dict[str, Set[asyncio.Queue]] = defaultdict(set)
+
+    def subscribe(self, user_id: str) -> asyncio.Queue:
+        """Open a queue receiving every event for this user"""
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        self._subscribers[user_id].add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: asyncio.Queue):
+        """Close a queue opened by subscribe"""
+        queues = self._subscribers.get(user_id)
+        if queues is None:
+            return
+        queues.discard(queue)
+        if not queues:
+            del self._subscribers[user_id]
+
+    def publish_local(self, user_ids: Iterable[str], event: dict):
+        """Deliver an event to this worker's subscribers"""
+        for user_id in set(user_ids):
+            for queue in self._subscribers.get(user_id, ()):
+                try:
+                    queue.put_nowait(event)
+                except asyncio.QueueFull:
+                    # A slow client missed events; tell it to refetch instead
+                    while not queue.empty():
+                        queue.get_nowait()
+                    queue.put_nowait({"type": "resync"})
+
+    def connection_count(self) -> int:
+        """Count open subscriber queues"""
+        return sum(len(queues) for queues in self._subscribers.values())
+
+event_hub = EventHub()
+
+async def publish_event(db: AsyncIOMotorDatabase, current_user: dict, event: dict):
+    """Publish an event to both partners, on this worker and, if bridged, on others"""
+    user_ids = [user_id for user_id in (current_user["id"], current_user.get("partner_id")) if user_id]
+    event_hub.publish_local(user_ids, event)
+
+    if EVENT_BRIDGE == "changestream":
+        try:
+            await db.events.insert_one({
+                "user_ids": user_ids,
+                "event": event,
+                "origin": WORKER_ID,
+                "created_at": datetime.utcnow()
+            })
+        except Exception:
+            logger.exception("Error bridging event %s", event.get("type"))
+
+async def run_change_stream_bridge(db: AsyncIOMotorDatabase):
+    """Relay events published by other workers to this worker's subscribers"""
+    pipeline = [{"$match": {"operationType": "insert", "fullDocument.origin": {"$ne": WORKER_ID}}}]
+    resume_token: Optional[dict] = None
+    while True:
+        try:
+            async with db.events.watch(pipeline, resume_after=resume_token) as stream:
+                async for change in stream:
+                    resume_token = stream.resume_token
+                    doc = change["fullDocument"]
+                    event_hub.publish_local(doc["user_ids"], doc["event"])
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Event change stream failed; reconnecting")
+            await asyncio.sleep(1)
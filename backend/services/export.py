@@ -0,0 +1,158 @@
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from services.couple_context import couple_filter
+from storage.blob_store import get_blob_store
+from typing import AsyncIterator, List, Optional
+import base64
+import mimetypes
+import orjson
+import os
+import zipfile
+
+# Export configuration
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE", "200"))
+EXPORT_FORMAT_VERSION = 1
+
+def export_sections(current_user: dict) -> List[dict]:
+    """The collections in an export, each with the query selecting the couple's documents"""
+    user_ids = [current_user["id"], current_user.get("partner_id", "")]
+    return [
+        {
+            "name": "letters",
+            "query": couple_filter(current_user, {"$or": [
+                {"from_user_id": {"$in": user_ids}}, {"to_user_id": {"$in": user_ids}}
+            ]}),
+            "sort": [("created_at", 1), ("id", 1)],
+        },
+        {
+            "name": "moods",
+            "query": couple_filter(current_user, {"user_id": {"$in": user_ids}}),
+            "sort": [("created_at", 1), ("id", 1)],
+        },
+        {
+            "name": "photos",
+            "query": couple_filter(current_user, {"uploaded_by": {"$in": user_ids}}),
+            "sort": [("created_at", 1), ("id", 1)],
+            # Photo bytes go into the zip as files, never inline
+            "projection": {"_id": 0, "image_base64": 0},
+        },
+        {
+            # No index orders a couple's answers by date, so keep index order
+            "name": "answers",
+            "query": couple_filter(current_user, {"user_id": {"$in": user_ids}}),
+            "sort": None,
+        },
+        {
+            "name": "notifications",
+            "query": {"user_id": current_user["id"]},
+            "sort": [("created_at", 1)],
+        },
+    ]
+
+def export_header(current_user: dict) -> dict:
+    """The first record of an export, describing who exported it and when"""
+    return {
+        "version": EXPORT_FORMAT_VERSION,
+        "exported_at": datetime.utcnow(),
+        "user_id": current_user["id"],
+        "username": current_user["username"],
+        "partner_id": current_user.get("partner_id"),
+        "partner_name": current_user.get("partner_name"),
+    }
+
+def dump_line(collection: str, document: dict) -> bytes:
+    return orjson.dumps({"collection": collection, "document": document}) + b"\n"
+
+async def section_lines(db: AsyncIOMotorDatabase, section: dict) -> AsyncIterator[bytes]:
+    """Yield a section's documents as NDJSON, one cursor batch per chunk"""
+    cursor = db[section["name"]].find(section["query"], section.get("projection", {"_id": 0}))
+    if section["sort"]:
+        cursor = cursor.sort(section["sort"])
+    cursor = cursor.batch_size(EXPORT_BATCH_SIZE)
+
+    lines = []
+    async for doc in cursor:
+        lines.append(dump_line(section["name"], doc))
+        if len(lines) >= EXPORT_BATCH_SIZE:
+            yield b"".join(lines)
+            lines = []
+    if lines:
+        yield b"".join(lines)
+
+async def export_ndjson(db: AsyncIOMotorDatabase, current_user: dict) -> AsyncIterator[bytes]:
+    """Stream a couple's history as NDJSON, each line naming the collection it came from"""
+    yield dump_line("export", export_header(current_user))
+    for section in export_sections(current_user):
+        async for chunk in section_lines(db, section):
+            yield chunk
+
+class ChunkSink:
+    """Write-only file object collecting what zipfile writes, to be drained between chunks"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def write(self, data: bytes) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def photo_filename(photo_id: str, content_type: Optional[str]) -> str:
+    extension = mimetypes.guess_extension(content_type or "") or ""
+    return f"photos/{photo_id}{extension}"
+
+def stored_entry(filename: str) -> zipfile.ZipInfo:
+    """A zip entry written without compression"""
+    info = zipfile.ZipInfo(filename, date_time=datetime.utcnow().timetuple()[:6])
+    info.compress_type = zipfile.ZIP_STORED
+    return info
+
+async def export_zip(db: AsyncIOMotorDatabase, current_user: dict) -> AsyncIterator[bytes]:
+    """Stream a zip with one NDJSON file per collection and every original photo"""
+    sink = ChunkSink()
+    # The sink can't seek, so zipfile writes sizes after each entry's data
+    archive = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED)
+
+    with archive.open("export.json", "w") as entry:
+        entry.write(orjson.dumps(export_header(current_user), option=orjson.OPT_INDENT_2))
+    yield sink.drain()
+
+    sections = export_sections(current_user)
+    for section in sections:
+        with archive.open(f"{section['name']}.ndjson", "w", force_zip64=True) as entry:
+            async for chunk in section_lines(db, section):
+                entry.write(chunk)
+                yield sink.drain()
+        yield sink.drain()
+
+    # Photos are already compressed, so store them as they are
+    store = get_blob_store(db)
+    photos = db.photos.find(
+        next(section for section in sections if section["name"] == "photos")["query"],
+        {"_id": 0, "id": 1, "blob_key": 1, "content_type": 1}
+    ).batch_size(EXPORT_BATCH_SIZE)
+    async for photo in photos:
+        if photo.get("blob_key"):
+            filename = photo_filename(photo["id"], photo.get("content_type"))
+            with archive.open(stored_entry(filename), "w", force_zip64=True) as entry:
+                async for chunk in store.stream(photo["blob_key"]):
+                    entry.write(chunk)
+                    yield sink.drain()
+        else:
+            # Photos uploaded before the blob store keep their bytes inline, as a data URL
+            legacy = await db.photos.find_one({"id": photo["id"]}, {"_id": 0, "image_base64": 1}) or {}
+            header, _, data = (legacy.get("image_base64") or "").rpartition(",")
+            content_type = header.partition(":")[2].partition(";")[0]
+            with archive.open(stored_entry(photo_filename(photo["id"], content_type)), "w") as entry:
+                entry.write(base64.b64decode(data))
+        yield sink.drain()
+
+    archive.close()
+    yield sink.drain()
@@ -0,0 +1,242 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from storage.blob_store import get_blob_store, release_photo_blob, store_photo_blob
+from typing import AsyncIterator, Callable, Dict, Optional
+import asyncio
+import base64
+import io
+import logging
+import multiprocessing
+import os
+
+logger = logging.getLogger(__name__)
+
+# Derivative configuration
+THUMBNAIL_SIZE = (320, 320)
+MEDIUM_MAX_SIZE = (1280, 1280)
+DERIVATIVE_QUALITY = 80
+ORIGINAL_QUALITY = 95
+# WebP can't encode images wider or taller than this
+WEBP_MAX_DIMENSION = 16383
+IMAGE_WORKERS = int(os.environ.get("IMAGE_WORKERS", "2"))
+# Larger images are refused before decoding, so a decompression bomb can't exhaust a worker
+MAX_IMAGE_PIXELS = int(os.environ.get("MAX_IMAGE_PIXELS", str(50_000_000)))
+
+# Backfill configuration
+PHOTO_BACKFILL_BATCH_SIZE = 100
+PHOTO_BACKFILL_LEASE = timedelta(minutes=5)
+# Newer photos are still being rendered by their upload's background task
+PHOTO_BACKFILL_MIN_AGE = timedelta(minutes=10)
+PHOTO_BACKFILL_MARKER = "photo_derivatives"
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+def open_oriented(data: bytes):
+    """Decode an image in a worker, applying its EXIF orientation and refusing oversized ones"""
+    from PIL import Image, ImageOps, features
+
+    # Pillow refuses twice this limit on open and only warns below that
+    Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+    with Image.open(io.BytesIO(data)) as source:
+        if source.width * source.height > MAX_IMAGE_PIXELS:
+            raise Image.DecompressionBombError(
+                f"Image has {source.width * source.height} pixels, more than the {MAX_IMAGE_PIXELS} allowed"
+            )
+
+        # Apply the EXIF orientation before the metadata is dropped
+        image = ImageOps.exif_transpose(source)
+
+    if features.check("webp") and max(image.size) <= WEBP_MAX_DIMENSION:
+        image_format, content_type = "WEBP", "image/webp"
+    else:
+        image_format, content_type = "JPEG", "image/jpeg"
+    if image.mode not in ("RGB", "RGBA") or image_format == "JPEG":
+        image = image.convert("RGB")
+    return image, image_format, content_type
+
+def encode_image(image, image_format: str, content_type: str, quality: int) -> Dict:
+    """Encode an image, leaving out all of its source's metadata"""
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, quality=quality)
+    return {
+        "data": buffer.getvalue(),
+        "content_type": content_type,
+        "width": image.width,
+        "height": image.height,
+    }
+
+def render_original(data: bytes) -> Dict:
+    """Re-encode an image at full size without EXIF
+
+    Runs inside a worker process.
+    """
+    image, image_format, content_type = open_oriented(data)
+    return encode_image(image, image_format, content_type, ORIGINAL_QUALITY)
+
+def render_derivatives(data: bytes) -> Dict:
+    """Decode an image once and encode its original, medium and thumbnail derivatives
+
+    Runs inside a worker process. Derivatives are re-encoded without EXIF,
+    so the "original" derivative is the full-size image minus its GPS
+    position and camera details.
+    """
+    from PIL import ImageOps
+
+    image, image_format, content_type = open_oriented(data)
+
+    thumbnail = ImageOps.fit(image, THUMBNAIL_SIZE)
+    medium = image.copy()
+    medium.thumbnail(MEDIUM_MAX_SIZE)
+
+    derivatives = {
+        "original": encode_image(image, image_format, content_type, ORIGINAL_QUALITY),
+        "medium": encode_image(medium, image_format, content_type, DERIVATIVE_QUALITY),
+        "thumbnail": encode_image(thumbnail, image_format, content_type, DERIVATIVE_QUALITY),
+    }
+    return {"width": image.width, "height": image.height, "derivatives": derivatives}
+
+def get_executor() -> ProcessPoolExecutor:
+    """Get the shared image worker pool"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(
+            max_workers=IMAGE_WORKERS,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+def discard_executor(executor: ProcessPoolExecutor):
+    """Drop a broken worker pool so the next render starts a fresh one"""
+    global _executor
+    if _executor is executor:
+        _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+async def run_render(data: bytes, render: Callable[[bytes], Dict] = render_derivatives) -> Dict:
+    """Render an image in the worker pool, replacing the pool if a worker died"""
+    loop = asyncio.get_running_loop()
+    executor = get_executor()
+    try:
+        return await loop.run_in_executor(executor, render, data)
+    except BrokenProcessPool:
+        # A worker was killed mid-render (e.g. out of memory); one more try on a fresh pool
+        logger.warning("Image worker pool broke, starting a new one")
+        discard_executor(executor)
+
+    executor = get_executor()
+    try:
+        return await loop.run_in_executor(executor, render, data)
+    except BrokenProcessPool:
+        discard_executor(executor)
+        raise
+
+def shutdown_image_pipeline():
+    """Stop the image worker pool"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+async def single_chunk(data: bytes) -> AsyncIterator[bytes]:
+    yield data
+
+async def process_photo(db: AsyncIOMotorDatabase, photo_id: str, blob_key: str):
+    """Generate derivatives for an uploaded photo and record them on the photo"""
+    store = get_blob_store(db)
+
+    try:
+        original = b"".join([chunk async for chunk in store.stream(blob_key)])
+
+        rendered = await run_render(original)
+
+        derivatives = {}
+        for name, derivative in rendered["derivatives"].items():
+            blob = await store_photo_blob(db, single_chunk(derivative["data"]))
+            derivatives[name] = {
+                "blob_key": blob.key,
+                "content_type": derivative["content_type"],
+                "size": blob.size,
+                "width": derivative["width"],
+                "height": derivative["height"],
+            }
+
+        previous = await db.photos.find_one_and_update(
+            {"id": photo_id},
+            {"$set": {
+                "width": rendered["width"],
+                "height": rendered["height"],
+                "derivatives": derivatives,
+            }},
+            projection={"derivatives": 1}
+        )
+
+        if previous is None:
+            # The photo was deleted while its derivatives were being rendered
+            replaced = derivatives
+        else:
+            # Re-rendering a backfilled photo drops its older derivatives
+            replaced = previous.get("derivatives") or {}
+        for derivative in replaced.values():
+            await release_photo_blob(db, derivative["blob_key"])
+    except Exception:
+        logger.exception("Error generating derivatives for photo %s", photo_id)
+
+async def move_inline_photo(db: AsyncIOMotorDatabase, photo_id: str) -> Optional[str]:
+    """Move a photo from before the blob store into it, returning its blob key"""
+    photo = await db.photos.find_one({"id": photo_id}, {"_id": 0, "image_base64": 1}) or {}
+    header, _, data = (photo.get("image_base64") or "").rpartition(",")
+    if not data:
+        return None
+
+    blob = await store_photo_blob(db, single_chunk(base64.b64decode(data)))
+    result = await db.photos.update_one(
+        {"id": photo_id, "blob_key": None},
+        {
+            "$set": {
+                "blob_key": blob.key,
+                "content_type": header[len("data:"):].split(";")[0] if header else "image/jpeg",
+                "size": blob.size,
+            },
+            "$unset": {"image_base64": ""},
+        }
+    )
+    if not result.modified_count:
+        await release_photo_blob(db, blob.key)
+        return None
+    return blob.key
+
+async def backfill_photo_derivatives(db: AsyncIOMotorDatabase):
+    """Render derivatives, and the stripped original, for photos uploaded before them, once"""
+    if await db.schema_migrations.find_one({"_id": PHOTO_BACKFILL_MARKER}):
+        return
+
+    rendered = 0
+    query = {
+        "derivatives.original": {"$exists": False},
+        "created_at": {"$lt": datetime.utcnow() - PHOTO_BACKFILL_MIN_AGE},
+    }
+    photos = db.photos.find(query, {"_id": 0, "id": 1, "blob_key": 1}).batch_size(PHOTO_BACKFILL_BATCH_SIZE)
+    async for photo in photos:
+        # Lease each photo so workers starting together don't render it twice
+        now = datetime.utcnow()
+        claimed = await db.photos.update_one(
+            {"id": photo["id"], "$or": [
+                {"backfill_lease_until": None}, {"backfill_lease_until": {"$lt": now}}
+            ]},
+            {"$set": {"backfill_lease_until": now + PHOTO_BACKFILL_LEASE}}
+        )
+        if not claimed.modified_count:
+            continue
+
+        blob_key = photo.get("blob_key") or await move_inline_photo(db, photo["id"])
+        if blob_key:
+            await process_photo(db, photo["id"], blob_key)
+            rendered += 1
+
+    await db.schema_migrations.update_one(
+        {"_id": PHOTO_BACKFILL_MARKER}, {"$set": {"done": True}}, upsert=True
+    )
+    logger.info("Rendered derivatives for %d existing photos", rendered)
@@ -0,0 +1,284 @@
+from collections import defaultdict
+from pymongo import monitoring
+from typing import Dict, Iterable, List, Optional, Tuple
+import bisect
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Metrics configuration
+MONGO_SLOW_QUERY_MS = float(os.environ.get("MONGO_SLOW_QUERY_MS", "100"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+COUNT_BUCKETS = (0, 1, 5, 10, 50, 100, 500, 1000, 5000)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+def _labels(labels: Dict[str, str]) -> Labels:
+    return tuple(sorted(labels.items()))
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}"
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+class Metric:
+    """A named Prometheus metric family, keyed by label set
+
+    Observations can arrive from pymongo's monitoring threads, so every
+    update takes the metric's lock.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+
+    def samples(self) -> Iterable[str]:
+        raise NotImplementedError
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return lines
+
+class Counter(Metric):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: Dict[Labels, float] = defaultdict(float)
+
+    def inc(self, amount: float = 1, **labels: str):
+        with self._lock:
+            self._values[_labels(labels)] += amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for labels, value in values:
+            yield f"{self.name}{_format_labels(labels)} {_format_value(value)}"
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels: str):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: str):
+        with self._lock:
+            self._values[_labels(labels)] = value
+
+class Histogram(Metric):
+    """Cumulative bucketed distribution with a running sum and count"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = buckets
+        # Per label set: [per-bucket counts (+Inf last), sum]
+        self._values: Dict[Labels, list] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = _labels(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            values = [(labels, list(counts), total) for labels, (counts, total) in self._values.items()]
+        for labels, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                yield f"{self.name}_bucket{_format_labels(labels, ('le', le))} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}"
+            yield f"{self.name}_count{_format_labels(labels)} {cumulative}"
+
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template"
+)
+HTTP_RESPONSE_SIZE = Histogram(
+    "http_response_size_bytes", "HTTP response body size by route template", SIZE_BUCKETS
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being handled"
+)
+HTTP_REQUESTS_REJECTED = Counter(
+    "http_requests_rejected_total", "HTTP requests turned away by admission control, by group and reason"
+)
+MONGO_COMMAND_DURATION = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency by collection and command"
+)
+MONGO_DOCUMENTS_RETURNED = Histogram(
+    "mongo_documents_returned", "Documents returned per MongoDB read command", COUNT_BUCKETS
+)
+MONGO_COMMAND_FAILURES = Counter(
+    "mongo_command_failures_total", "Failed MongoDB commands by collection and command"
+)
+
+MONGO_POOL_CONNECTIONS = Gauge(
+    "mongo_pool_connections", "Open connections in each MongoDB connection pool"
+)
+MONGO_POOL_CHECKED_OUT = Gauge(
+    "mongo_pool_checked_out", "Connections currently checked out of each pool"
+)
+MONGO_POOL_WAITERS = Gauge(
+    "mongo_pool_waiters", "Operations waiting to check out a connection"
+)
+MONGO_POOL_CHECKOUT_FAILURES = Counter(
+    "mongo_pool_checkout_failures_total", "Connection checkouts that failed, by reason"
+)
+
+METRICS: List[Metric] = [
+    HTTP_REQUEST_DURATION,
+    HTTP_RESPONSE_SIZE,
+    HTTP_REQUESTS_IN_FLIGHT,
+    HTTP_REQUESTS_REJECTED,
+    MONGO_COMMAND_DURATION,
+    MONGO_DOCUMENTS_RETURNED,
+    MONGO_COMMAND_FAILURES,
+    MONGO_POOL_CONNECTIONS,
+    MONGO_POOL_CHECKED_OUT,
+    MONGO_POOL_WAITERS,
+    MONGO_POOL_CHECKOUT_FAILURES,
+]
+
+# Commands whose replies carry a cursor batch worth counting
+CURSOR_COMMANDS = {"find", "aggregate", "getMore"}
+
+class CommandMetricsListener(monitoring.CommandListener):
+    """Time every MongoDB command and log the slow ones"""
+
+    def __init__(self, slow_query_ms: float = MONGO_SLOW_QUERY_MS):
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        # (connection, request id) -> (collection, command summary)
+        self._pending: Dict[tuple, tuple] = {}
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        command = event.command
+        if event.command_name == "getMore":
+            collection = command.get("collection", "")
+        else:
+            collection = command.get(event.command_name, "")
+        if not isinstance(collection, str):
+            collection = ""
+        with self._lock:
+            self._pending[(event.connection_id, event.request_id)] = (collection, command)
+
+    def _finish(self, event) -> Optional[tuple]:
+        with self._lock:
+            return self._pending.pop((event.connection_id, event.request_id), None)
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        pending = self._finish(event)
+        if pending is None:
+            return
+        collection, command = pending
+        seconds = event.duration_micros / 1_000_000
+        labels = {"collection": collection, "command": event.command_name}
+        MONGO_COMMAND_DURATION.observe(seconds, **labels)
+
+        if event.command_name in CURSOR_COMMANDS:
+            cursor = event.reply.get("cursor") or {}
+            batch = cursor.get("firstBatch", cursor.get("nextBatch", []))
+            MONGO_DOCUMENTS_RETURNED.observe(len(batch), **labels)
+
+        if seconds * 1000 >= self.slow_query_ms:
+            logger.warning(
+                "Slow MongoDB %s on %s.%s took %.1f ms: %s",
+                event.command_name, event.database_name, collection, seconds * 1000,
+                _summarize(command)
+            )
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        pending = self._finish(event)
+        collection = pending[0] if pending else ""
+        MONGO_COMMAND_FAILURES.inc(collection=collection, command=event.command_name)
+
+def _summarize(command: dict) -> str:
+    """Shape of a command for the slow-query log, without document bodies"""
+    keys = ("filter", "sort", "pipeline", "limit", "hint")
+    parts = {key: command[key] for key in keys if key in command}
+    return str(parts)[:500]
+
+command_metrics = CommandMetricsListener()
+
+def _address(event) -> str:
+    host, port = event.address
+    return f"{host}:{port}"
+
+class PoolMetricsListener(monitoring.ConnectionPoolListener):
+    """Track connection pool occupancy and checkout queueing per server"""
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        address = _address(event)
+        for gauge in (MONGO_POOL_CONNECTIONS, MONGO_POOL_CHECKED_OUT, MONGO_POOL_WAITERS):
+            gauge.set(0, address=address)
+
+    def connection_created(self, event):
+        MONGO_POOL_CONNECTIONS.inc(address=_address(event))
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        MONGO_POOL_CONNECTIONS.dec(address=_address(event))
+
+    def connection_check_out_started(self, event):
+        MONGO_POOL_WAITERS.inc(address=_address(event))
+
+    def connection_check_out_failed(self, event):
+        address = _address(event)
+        MONGO_POOL_WAITERS.dec(address=address)
+        MONGO_POOL_CHECKOUT_FAILURES.inc(address=address, reason=str(event.reason))
+
+    def connection_checked_out(self, event):
+        address = _address(event)
+        MONGO_POOL_WAITERS.dec(address=address)
+        MONGO_POOL_CHECKED_OUT.inc(address=address)
+
+    def connection_checked_in(self, event):
+        MONGO_POOL_CHECKED_OUT.dec(address=_address(event))
+
+pool_metrics = PoolMetricsListener()
+
+def render_metrics(extra: Iterable[Metric] = ()) -> str:
+    """Render every registered metric in the Prometheus text exposition format"""
+    lines: List[str] = []
+    for metric in list(METRICS) + list(extra):
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
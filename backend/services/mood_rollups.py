@@ -0,0 +1,179 @@
+from collections import defaultdict
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+from typing import Awaitable, Callable, Dict, Optional
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Rollup configuration
+MOOD_ROLLUP_INTERVAL = int(os.environ.get("MOOD_ROLLUP_INTERVAL_SECONDS", str(60 * 60)))
+MOOD_ROLLUP_BATCH_SIZE = 1000
+# A day is only rebuilt this long after it ends, once late share_mood increments have landed
+MOOD_ROLLUP_GRACE = timedelta(seconds=int(os.environ.get("MOOD_ROLLUP_GRACE_SECONDS", str(60 * 60))))
+# Records the last day whose rollups were rebuilt from the raw moods, and leases the rebuild
+MOOD_ROLLUP_MARKER = "mood_rollups"
+MOOD_ROLLUP_LEASE = timedelta(minutes=5)
+
+# mood_rollups holds one document per user per UTC day:
+#   {user_id, day: "YYYY-MM-DD", total, moods: {mood: n}, emojis: {emoji: n},
+#    latest_mood, latest_note, latest_at}
+
+def rollup_day(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%d")
+
+def encode_key(value: str) -> str:
+    """Make a user-supplied mood or emoji safe to use as a field name in update paths"""
+    return value.replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+def decode_key(key: str) -> str:
+    return key.replace("%24", "$").replace("%2E", ".").replace("%25", "%")
+
+def decode_counts(counts: Optional[Dict[str, int]]) -> Dict[str, int]:
+    return {decode_key(key): count for key, count in (counts or {}).items()}
+
+async def record_mood(db: AsyncIOMotorDatabase, mood: dict):
+    """Count a newly shared mood into its user's rollup for the day"""
+    update = {
+        "$inc": {
+            "total": 1,
+            f"moods.{encode_key(mood['mood'])}": 1,
+            f"emojis.{encode_key(mood['emoji'])}": 1,
+        },
+        "$set": {
+            "latest_mood": mood["mood"],
+            "latest_note": mood["note"],
+            "latest_at": mood["created_at"],
+        },
+    }
+    key = {"user_id": mood["user_id"], "day": rollup_day(mood["created_at"])}
+    try:
+        await db.mood_rollups.update_one(key, update, upsert=True)
+    except DuplicateKeyError:
+        # Another request created the day's rollup first; it exists now
+        await db.mood_rollups.update_one(key, update)
+
+async def rebuild_mood_rollups(
+    db: AsyncIOMotorDatabase,
+    start: Optional[datetime],
+    end: datetime,
+    on_flush: Optional[Callable[[], Awaitable]] = None
+) -> int:
+    """Recompute the rollups of every whole day in [start, end) from the raw moods"""
+    query = {"created_at": {"$lt": end}}
+    if start is not None:
+        query["created_at"]["$gte"] = start
+
+    rollups = defaultdict(lambda: {"total": 0, "moods": defaultdict(int), "emojis": defaultdict(int)})
+    current_day = None
+    rebuilt = 0
+
+    async def flush():
+        nonlocal rebuilt
+        if not rollups:
+            return
+        await db.mood_rollups.bulk_write([
+            UpdateOne({"user_id": user_id, "day": day}, {"$set": {
+                "total": rollup["total"],
+                "moods": {encode_key(mood): count for mood, count in rollup["moods"].items()},
+                "emojis": {encode_key(emoji): count for emoji, count in rollup["emojis"].items()},
+                "latest_mood": rollup["latest_mood"],
+                "latest_note": rollup["latest_note"],
+                "latest_at": rollup["latest_at"],
+            }}, upsert=True)
+            for (user_id, day), rollup in rollups.items()
+        ], ordered=False)
+        rebuilt += len(rollups)
+        rollups.clear()
+        if on_flush is not None:
+            await on_flush()
+
+    # Moods arrive in time order, so each day's rollups are complete when the day changes
+    moods = db.moods.find(
+        query, {"_id": 0, "user_id": 1, "mood": 1, "emoji": 1, "note": 1, "created_at": 1}
+    ).sort("created_at", 1).batch_size(MOOD_ROLLUP_BATCH_SIZE)
+    async for mood in moods:
+        day = rollup_day(mood["created_at"])
+        if day != current_day:
+            await flush()
+            current_day = day
+        rollup = rollups[(mood["user_id"], day)]
+        rollup["total"] += 1
+        rollup["moods"][mood["mood"]] += 1
+        rollup["emojis"][mood["emoji"]] += 1
+        rollup["latest_mood"] = mood["mood"]
+        rollup["latest_note"] = mood["note"]
+        rollup["latest_at"] = mood["created_at"]
+    await flush()
+    return rebuilt
+
+async def claim_mood_rollup_sync(db: AsyncIOMotorDatabase, lease_until: datetime) -> Optional[dict]:
+    """Lease the rollup marker so only one worker rebuilds at a time"""
+    now = datetime.utcnow()
+    try:
+        return await db.schema_migrations.find_one_and_update(
+            {"_id": MOOD_ROLLUP_MARKER, "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]},
+            {"$set": {"lease_until": lease_until}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # The marker exists and another worker holds its lease
+        return None
+
+async def sync_mood_rollups(db: AsyncIOMotorDatabase, now: Optional[datetime] = None):
+    """Rebuild the rollups of days that closed since the last sync
+
+    share_mood keeps recent rollups current; rebuilding closed days from
+    the raw moods covers history from before rollups existed and corrects
+    any increment that was lost. A day is rebuilt only once the grace
+    period after it has passed, so an increment for a mood shared just
+    before midnight can't land on top of the rebuilt counts. Every worker
+    runs this job, but the first to lease the marker does the rebuild.
+    """
+    now = now or datetime.utcnow()
+    end = (now - MOOD_ROLLUP_GRACE).replace(hour=0, minute=0, second=0, microsecond=0)
+    marker = await db.schema_migrations.find_one({"_id": MOOD_ROLLUP_MARKER})
+    if marker and marker.get("through") is not None and marker["through"] >= end:
+        return
+
+    lease = {"lease_until": datetime.utcnow() + MOOD_ROLLUP_LEASE}
+    marker = await claim_mood_rollup_sync(db, lease["lease_until"])
+    if marker is None:
+        return
+
+    async def extend_lease():
+        # A first rebuild over all history can outlast a single lease
+        until = datetime.utcnow() + MOOD_ROLLUP_LEASE
+        await db.schema_migrations.update_one(
+            {"_id": MOOD_ROLLUP_MARKER, **lease}, {"$set": {"lease_until": until}}
+        )
+        lease["lease_until"] = until
+
+    try:
+        # Another worker may have finished a rebuild between the check and the claim
+        start = marker.get("through")
+        if start is not None and start >= end:
+            return
+        rebuilt = await rebuild_mood_rollups(db, start, end, on_flush=extend_lease)
+        await db.schema_migrations.update_one(
+            {"_id": MOOD_ROLLUP_MARKER}, {"$set": {"through": end}}
+        )
+        logger.info("Rebuilt %d mood rollups up to %s", rebuilt, rollup_day(end))
+    finally:
+        await db.schema_migrations.update_one(
+            {"_id": MOOD_ROLLUP_MARKER, **lease}, {"$unset": {"lease_until": ""}}
+        )
+
+async def run_mood_rollup_job(db: AsyncIOMotorDatabase, interval: int = MOOD_ROLLUP_INTERVAL):
+    """Sync mood rollups now and then on every interval"""
+    while True:
+        try:
+            await sync_mood_rollups(db)
+        except Exception:
+            logger.exception("Error syncing mood rollups")
+        await asyncio.sleep(interval)
@@ -0,0 +1,107 @@
+from collections import Counter
+from datetime import date, timedelta
+from services.mood_rollups import decode_counts
+from typing import List, Optional, Tuple
+
+TOP_EMOJIS = 5
+
+def run_lengths(active) -> Tuple[int, int]:
+    """Longest run of active days, and the run still going today or yesterday"""
+    import numpy as np
+
+    edges = np.diff(np.concatenate(([0], active.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    if not len(starts):
+        return 0, 0
+    lengths = ends - starts
+    # A streak isn't broken until a whole day passes without a mood
+    current = int(lengths[-1]) if ends[-1] >= len(active) - 1 else 0
+    return int(lengths.max()), current
+
+def compute_mood_stats(rollups: List[dict], user_ids: List[str], start: date, end: date) -> dict:
+    """Streaks, mood distributions and partner alignment over the days [start, end]"""
+    # Deferred so NumPy only loads once someone asks for stats
+    import numpy as np
+
+    n_days = (end - start).days + 1
+    days = [(start + timedelta(days=offset)).isoformat() for offset in range(n_days)]
+    user_index = {user_id: index for index, user_id in enumerate(user_ids)}
+
+    # One (user, day, mood, count) row per rollup entry, scattered into a dense cube
+    rows = []
+    emojis = [Counter() for _ in user_ids]
+    for rollup in rollups:
+        user = user_index[rollup["user_id"]]
+        day = (date.fromisoformat(rollup["day"]) - start).days
+        if not 0 <= day < n_days:
+            continue
+        for mood, count in decode_counts(rollup.get("moods")).items():
+            rows.append((user, day, mood, count))
+        emojis[user].update(decode_counts(rollup.get("emojis")))
+
+    moods = sorted({mood for _, _, mood, _ in rows})
+    mood_index = {mood: index for index, mood in enumerate(moods)}
+    counts = np.zeros((len(user_ids), n_days, max(len(moods), 1)), dtype=np.int64)
+    if rows:
+        users, day_offsets, mood_names, values = zip(*rows)
+        np.add.at(counts, (
+            np.array(users), np.array(day_offsets), np.array([mood_index[mood] for mood in mood_names])
+        ), np.array(values))
+
+    daily = counts.sum(axis=2)
+    active = daily > 0
+    dominant = np.where(active, counts.argmax(axis=2), -1)
+    totals = counts.sum(axis=1)
+
+    users = []
+    for user, user_id in enumerate(user_ids):
+        total = int(totals[user].sum())
+        longest, current = run_lengths(active[user])
+        users.append({
+            "user_id": user_id,
+            "total": total,
+            "active_days": int(active[user].sum()),
+            "current_streak": current,
+            "longest_streak": longest,
+            "distribution": {
+                mood: float(totals[user, index] / total)
+                for index, mood in enumerate(moods) if total and totals[user, index]
+            },
+            "top_emojis": [emoji for emoji, _ in emojis[user].most_common(TOP_EMOJIS)],
+            "daily_totals": daily[user].tolist(),
+            "daily_moods": [moods[index] if index >= 0 else None for index in dominant[user].tolist()],
+        })
+
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "days": days,
+        "users": users,
+        "alignment": partner_alignment(counts, active, dominant) if len(user_ids) == 2 else None,
+    }
+
+def partner_alignment(counts, active, dominant) -> dict:
+    """How often both partners shared a mood on the same day, and how alike those moods were"""
+    import numpy as np
+
+    both = active[0] & active[1]
+    shared_days = int(both.sum())
+    same_mood_days = int((both & (dominant[0] == dominant[1])).sum())
+    longest, current = run_lengths(both)
+
+    similarity: Optional[float] = None
+    if shared_days:
+        # Cosine similarity of each shared day's mood counts, averaged over the days
+        ours, theirs = counts[0][both], counts[1][both]
+        norms = np.linalg.norm(ours, axis=1) * np.linalg.norm(theirs, axis=1)
+        similarity = float(((ours * theirs).sum(axis=1) / norms).mean())
+
+    return {
+        "shared_days": shared_days,
+        "same_mood_days": same_mood_days,
+        "agreement": same_mood_days / shared_days if shared_days else None,
+        "similarity": similarity,
+        "current_streak": current,
+        "longest_streak": longest,
+    }
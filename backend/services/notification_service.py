@@ -1,83 +1,207 @@
-from datetime import datetime, timedelta
+from collections import defaultdict
+from datetime import datetime, timedelta, date
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
 from models.notification import Notification
-from typing import List
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import os
 
-async def generate_anniversary_notifications(db: AsyncIOMotorDatabase):
+logger = logging.getLogger(__name__)
+
+# How often the background job looks for due anniversaries
+NOTIFICATION_JOB_INTERVAL = int(os.environ.get("NOTIFICATION_JOB_INTERVAL_SECONDS", str(60 * 60)))
+# How often unread counters are recounted to correct drift
+UNREAD_RECONCILE_INTERVAL = int(os.environ.get("UNREAD_RECONCILE_INTERVAL_SECONDS", str(60 * 60)))
+
+# Reminder messages keyed by days until the anniversary
+ANNIVERSARY_MESSAGES = {
+    7: "Your anniversary is coming up in 7 days! 💕",
+    1: "Tomorrow is your special day! Don't forget to celebrate 🎉",
+    0: "Happy Anniversary! 💕🎊 Wishing you both a wonderful day!",
+}
+
+def anniversary_month_day(anniversary_date: Optional[str]) -> Optional[str]:
+    """Get the "MM-DD" part of an anniversary date (format: "2024-05-14")"""
+    if not anniversary_date:
+        return None
+    try:
+        return datetime.strptime(anniversary_date, "%Y-%m-%d").strftime("%m-%d")
+    except ValueError:
+        return None
+
+async def backfill_anniversary_month_days(db: AsyncIOMotorDatabase):
+    """Stamp users created before anniversary_md existed"""
+    async for user in db.users.find(
+        {"anniversary_md": {"$exists": False}, "anniversary_date": {"$exists": True, "$ne": None}},
+        {"id": 1, "anniversary_date": 1}
+    ):
+        await db.users.update_one(
+            {"id": user["id"]},
+            {"$set": {"anniversary_md": anniversary_month_day(user["anniversary_date"])}}
+        )
+
+async def generate_anniversary_notifications(db: AsyncIOMotorDatabase, today: Optional[date] = None):
     """Generate notifications for upcoming anniversaries"""
-    
-    # Get all users with anniversary dates
-    users = await db.users.find({"anniversary_date": {"$exists": True, "$ne": None}}).to_list(1000)
-    
-    today = datetime.now().date()
-    
-    for user in users:
-        if not user.get("anniversary_date"):
-            continue
-        
+    today = today or datetime.now().date()
+
+    # Anniversaries falling on each reminder day, keyed by "MM-DD"
+    due_days = {
+        (today + timedelta(days=days)).strftime("%m-%d"): days
+        for days in ANNIVERSARY_MESSAGES
+    }
+
+    users = db.users.find(
+        {"anniversary_md": {"$in": list(due_days)}},
+        {"id": 1, "anniversary_date": 1, "anniversary_md": 1}
+    )
+
+    operations = []
+    user_ids = []
+    async for user in users:
+        days_until = due_days[user["anniversary_md"]]
+        occurrence = today + timedelta(days=days_until)
+        notification = Notification(
+            user_id=user["id"],
+            type="anniversary",
+            message=ANNIVERSARY_MESSAGES[days_until],
+            date=user["anniversary_date"],
+            dedup_key=f"anniversary:{occurrence.isoformat()}:{days_until}"
+        )
+        operations.append(UpdateOne(
+            {"user_id": notification.user_id, "dedup_key": notification.dedup_key},
+            {"$setOnInsert": notification.dict()},
+            upsert=True
+        ))
+        user_ids.append(notification.user_id)
+
+    if not operations:
+        return
+
+    try:
+        result = await db.notifications.bulk_write(operations, ordered=False)
+        created = list(result.upserted_ids)
+        logger.info("Created %d anniversary notifications", result.upserted_count)
+    except BulkWriteError as e:
+        # Another worker inserted the same notification first
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+        created = [upserted["index"] for upserted in e.details["upserted"]]
+
+    # Only notifications this worker actually inserted are counted
+    new_unread = defaultdict(int)
+    for index in created:
+        new_unread[user_ids[index]] += 1
+    await add_unread_counts(db, new_unread)
+
+async def add_unread_counts(db: AsyncIOMotorDatabase, counts: Dict[str, int]):
+    """Atomically add to users' unread counters, creating missing ones"""
+    operations = [
+        UpdateOne({"user_id": user_id}, {"$inc": {"unread": count}}, upsert=True)
+        for user_id, count in counts.items() if count
+    ]
+    if not operations:
+        return
+
+    try:
+        await db.notification_counters.bulk_write(operations, ordered=False)
+    except BulkWriteError as e:
+        # Concurrent upserts of a new counter race on the unique index; the counter exists now
+        errors = e.details["writeErrors"]
+        if any(error["code"] != 11000 for error in errors):
+            raise
+        await db.notification_counters.bulk_write(
+            [operations[error["index"]] for error in errors], ordered=False
+        )
+
+async def subtract_unread_count(db: AsyncIOMotorDatabase, user_id: str, count: int):
+    """Take notifications that were just marked read off the user's unread counter"""
+    if count:
+        await db.notification_counters.update_one({"user_id": user_id}, {"$inc": {"unread": -count}})
+
+async def count_unread_notifications(db: AsyncIOMotorDatabase, user_id: str) -> int:
+    """Read the user's unread counter"""
+    counter = await db.notification_counters.find_one({"user_id": user_id}, {"_id": 0, "unread": 1})
+    if counter is None:
+        # Not counted yet; reconciliation creates the counter
+        return await db.notifications.count_documents({"user_id": user_id, "read": False})
+    return max(counter["unread"], 0)
+
+async def reconcile_unread_counts(db: AsyncIOMotorDatabase):
+    """Reset counters that drifted from the real number of unread notifications"""
+    counters = {
+        counter["user_id"]: counter["unread"]
+        async for counter in db.notification_counters.find({}, {"_id": 0, "user_id": 1, "unread": 1})
+    }
+    actual = {
+        group["_id"]: group["unread"]
+        async for group in db.notifications.aggregate([
+            {"$match": {"read": False}},
+            {"$sort": {"user_id": 1}},
+            {"$group": {"_id": "$user_id", "unread": {"$sum": 1}}}
+        ])
+    }
+
+    operations = []
+    for user_id in counters.keys() | actual.keys():
+        unread = actual.get(user_id, 0)
+        if user_id not in counters:
+            operations.append(UpdateOne(
+                {"user_id": user_id},
+                {"$setOnInsert": {"user_id": user_id, "unread": unread}},
+                upsert=True
+            ))
+        elif counters[user_id] != unread:
+            # Only if unchanged since it was read, so concurrent updates aren't lost
+            operations.append(UpdateOne(
+                {"user_id": user_id, "unread": counters[user_id]},
+                {"$set": {"unread": unread}}
+            ))
+
+    if not operations:
+        return
+
+    try:
+        result = await db.notification_counters.bulk_write(operations, ordered=False)
+        logger.info(
+            "Reconciled unread counters: %d created, %d corrected",
+            result.upserted_count, result.modified_count
+        )
+    except BulkWriteError as e:
+        # A counter was created concurrently; the next run picks it up
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+
+async def run_unread_reconciliation(db: AsyncIOMotorDatabase, interval: int = UNREAD_RECONCILE_INTERVAL):
+    """Recount unread notifications now and then on every interval"""
+    while True:
+        try:
+            await reconcile_unread_counts(db)
+        except Exception:
+            logger.exception("Error reconciling unread notification counters")
+        await asyncio.sleep(interval)
+
+async def run_notification_job(db: AsyncIOMotorDatabase, interval: int = NOTIFICATION_JOB_INTERVAL):
+    """Generate anniversary notifications now and then on every interval"""
+    try:
+        await backfill_anniversary_month_days(db)
+    except Exception:
+        logger.exception("Error backfilling anniversary dates")
+
+    while True:
         try:
-            # Parse anniversary date (assuming format: "2024-05-14")
-            anniversary = datetime.strptime(user["anniversary_date"], "%Y-%m-%d").date()
-            
-            # Get this year's anniversary
-            this_year_anniversary = anniversary.replace(year=today.year)
-            
-            # If this year's anniversary has passed, check next year
-            if this_year_anniversary < today:
-                this_year_anniversary = anniversary.replace(year=today.year + 1)
-            
-            days_until = (this_year_anniversary - today).days
-            
-            # Create notifications for 7 days before, 1 day before, and on the day
-            notifications_to_create = []
-            
-            if days_until == 7:
-                notifications_to_create.append({
-                    "type": "anniversary",
-                    "message": f"Your anniversary is coming up in 7 days! 💕",
-                    "date": user["anniversary_date"]
-                })
-            elif days_until == 1:
-                notifications_to_create.append({
-                    "type": "anniversary",
-                    "message": f"Tomorrow is your special day! Don't forget to celebrate 🎉",
-                    "date": user["anniversary_date"]
-                })
-            elif days_until == 0:
-                notifications_to_create.append({
-                    "type": "anniversary",
-                    "message": f"Happy Anniversary! 💕🎊 Wishing you both a wonderful day!",
-                    "date": user["anniversary_date"]
-                })
-            
-            # Insert notifications
-            for notif_data in notifications_to_create:
-                # Check if notification already exists
-                existing = await db.notifications.find_one({
-                    "user_id": user["id"],
-                    "type": notif_data["type"],
-                    "date": notif_data["date"],
-                    "message": notif_data["message"]
-                })
-                
-                if not existing:
-                    notification = Notification(
-                        user_id=user["id"],
-                        type=notif_data["type"],
-                        message=notif_data["message"],
-                        date=notif_data["date"]
-                    )
-                    await db.notifications.insert_one(notification.dict())
-        
-        except Exception as e:
-            print(f"Error processing anniversary for user {user['id']}: {e}")
-            continue
+            await generate_anniversary_notifications(db)
+        except Exception:
+            logger.exception("Error generating anniversary notifications")
+        await asyncio.sleep(interval)
 
 async def get_user_notifications(db: AsyncIOMotorDatabase, user_id: str) -> List[dict]:
     """Get all notifications for a user"""
-    
+
     notifications = await db.notifications.find(
         {"user_id": user_id}
     ).sort("created_at", -1).to_list(100)
-    
+
     return notifications
@@ -0,0 +1,54 @@
+from fastapi import HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorCollection
+from datetime import datetime
+from typing import List, Optional, Tuple
+import base64
+import binascii
+import json
+
+# Pagination configuration
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+def encode_cursor(doc: dict) -> str:
+    """Encode the (created_at, id) position of a document as an opaque cursor"""
+    position = {"created_at": doc["created_at"].isoformat(), "id": doc["id"]}
+    return base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    """Decode an opaque cursor back into its (created_at, id) position"""
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(position["created_at"]), str(position["id"])
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+async def paginate(
+    collection: AsyncIOMotorCollection,
+    query: dict,
+    limit: int,
+    cursor: Optional[str] = None,
+    projection: Optional[dict] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """Fetch one page of documents, newest first, keyed on (created_at, id)"""
+    if cursor:
+        created_at, doc_id = decode_cursor(cursor)
+        query = {"$and": [query, {"$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "id": {"$lt": doc_id}}
+        ]}]}
+
+    # Fetch one extra document to know whether another page exists
+    docs = await collection.find(query, projection).sort(
+        [("created_at", -1), ("id", -1)]
+    ).limit(limit + 1).to_list(limit + 1)
+
+    next_cursor = None
+    if len(docs) > limit:
+        docs = docs[:limit]
+        next_cursor = encode_cursor(docs[-1])
+
+    return docs, next_cursor
@@ -0,0 +1,176 @@
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple, Union
+import ipaddress
+import math
+import os
+import time
+
+# Rate limit configuration
+RATE_LIMIT_ENABLED = os.environ.get("RATE_LIMIT_ENABLED", "true").lower() == "true"
+# Proxies whose X-Forwarded-For is believed, as comma-separated CIDRs (Nginx on the same host by default)
+RATE_LIMIT_TRUSTED_PROXIES = os.environ.get("RATE_LIMIT_TRUSTED_PROXIES", "127.0.0.1/32,::1/128")
+RATE_LIMIT_MAX_KEYS = int(os.environ.get("RATE_LIMIT_MAX_KEYS", "100000"))
+
+# Long-lived or scrape requests that admission control should never see
+EXEMPT_PATHS = {"/metrics", "/api/events/stream"}
+AUTH_PATHS = {"/api/auth/login", "/api/auth/register"}
+UPLOAD_PREFIX = "/api/photos"
+READ_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+@dataclass
+class LimitPolicy:
+    ip_per_minute: float
+    ip_burst: int
+    # Keyed on the authenticated user, or on the submitted username and IP for auth routes; 0 disables it
+    user_per_minute: float
+    user_burst: int
+    concurrency: int  # requests of the group handled at once by this worker
+    max_body: int  # bytes
+
+def limit_policy(group: str, **defaults) -> LimitPolicy:
+    """A group's limits, each overridable as RATE_LIMIT_<GROUP>_<FIELD>"""
+    fields = {}
+    for name, default in defaults.items():
+        value = os.environ.get(f"RATE_LIMIT_{group.upper()}_{name.upper()}")
+        fields[name] = type(default)(value) if value is not None else default
+    return LimitPolicy(**fields)
+
+POLICIES: Dict[str, LimitPolicy] = {
+    # Every login and registration runs a bcrypt hash
+    "auth": limit_policy(
+        "auth", ip_per_minute=60.0, ip_burst=30, user_per_minute=10.0, user_burst=10,
+        concurrency=8, max_body=16 * 1024,
+    ),
+    "uploads": limit_policy(
+        "uploads", ip_per_minute=60.0, ip_burst=20, user_per_minute=30.0, user_burst=10,
+        concurrency=8, max_body=64 * 1024 * 1024,
+    ),
+    "writes": limit_policy(
+        "writes", ip_per_minute=300.0, ip_burst=60, user_per_minute=120.0, user_burst=30,
+        concurrency=64, max_body=1024 * 1024,
+    ),
+    "reads": limit_policy(
+        "reads", ip_per_minute=1200.0, ip_burst=200, user_per_minute=600.0, user_burst=120,
+        concurrency=256, max_body=64 * 1024,
+    ),
+}
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+def parse_networks(cidrs: str) -> List[Network]:
+    return [ipaddress.ip_network(cidr.strip(), strict=False) for cidr in cidrs.split(",") if cidr.strip()]
+
+TRUSTED_PROXIES = parse_networks(RATE_LIMIT_TRUSTED_PROXIES)
+
+def is_trusted(address: str, trusted: List[Network]) -> bool:
+    try:
+        ip = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip in network for network in trusted)
+
+def client_ip(
+    peer: Optional[str],
+    forwarded_for: Optional[str],
+    trusted: List[Network] = TRUSTED_PROXIES
+) -> str:
+    """The address a request came from, seen through any trusted proxies
+
+    Each proxy appends the address it received the request from, so hops
+    are read right to left and the first one that isn't a trusted proxy
+    is the client; anything further left could be forged by it.
+    """
+    if not peer:
+        return "unknown"
+    if not forwarded_for or not is_trusted(peer, trusted):
+        return peer
+
+    hops = [hop.strip() for hop in forwarded_for.split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not is_trusted(hop, trusted):
+            return hop
+    return hops[0] if hops else peer
+
+def route_group(method: str, path: str) -> Optional[str]:
+    """The limit group a request falls in, or None when it is exempt"""
+    if path in EXEMPT_PATHS:
+        return None
+    if path in AUTH_PATHS:
+        return "auth"
+    if method in READ_METHODS:
+        return "reads"
+    if method == "POST" and path.startswith(UPLOAD_PREFIX):
+        return "uploads"
+    return "writes"
+
+class TokenBuckets:
+    """Bounded LRU of token buckets, refilled lazily whenever one is drawn from"""
+
+    def __init__(self, max_size: int = RATE_LIMIT_MAX_KEYS):
+        self.max_size = max_size
+        self._buckets: "OrderedDict[Tuple[str, str, str], list]" = OrderedDict()
+
+    def take(self, key: Tuple[str, str, str], per_minute: float, burst: int) -> float:
+        """Take a token, returning 0 or the seconds until one will be available"""
+        now = time.monotonic()
+        rate = per_minute / 60
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = [float(burst), now]
+            self._buckets[key] = bucket
+            while len(self._buckets) > self.max_size:
+                # An evicted bucket was idle longest and comes back full
+                self._buckets.popitem(last=False)
+        else:
+            bucket[0] = min(float(burst), bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        self._buckets.move_to_end(key)
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / rate
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+class RateLimiter:
+    """Per-IP and per-user token buckets plus a per-group concurrency cap"""
+
+    def __init__(self, policies: Dict[str, LimitPolicy] = POLICIES):
+        self.policies = policies
+        self.buckets = TokenBuckets()
+        self.in_flight: Dict[str, int] = {group: 0 for group in policies}
+
+    def check_ip(self, group: str, ip: str) -> Optional[Tuple[str, int]]:
+        """Draw from the client's IP bucket, returning a rejection reason and Retry-After seconds"""
+        policy = self.policies[group]
+        if policy.ip_per_minute:
+            wait = self.buckets.take((group, "ip", ip), policy.ip_per_minute, policy.ip_burst)
+            if wait:
+                return "ip", math.ceil(wait)
+        return None
+
+    def check_user(self, group: str, user_key: Optional[str]) -> Optional[Tuple[str, int]]:
+        """Draw from the user's bucket and check the group's concurrency cap"""
+        policy = self.policies[group]
+        if user_key and policy.user_per_minute:
+            wait = self.buckets.take((group, "user", user_key), policy.user_per_minute, policy.user_burst)
+            if wait:
+                return "user", math.ceil(wait)
+        if self.in_flight[group] >= policy.concurrency:
+            return "concurrency", 1
+        return None
+
+    def check(self, group: str, ip: str, user_key: Optional[str]) -> Optional[Tuple[str, int]]:
+        """Admit a request or return why not and the seconds to wait before retrying"""
+        return self.check_ip(group, ip) or self.check_user(group, user_key)
+
+    def acquire(self, group: str):
+        self.in_flight[group] += 1
+
+    def release(self, group: str):
+        self.in_flight[group] -= 1
+
+rate_limiter = RateLimiter()
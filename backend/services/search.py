@@ -0,0 +1,218 @@
+from fastapi import HTTPException, status
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from typing import List, Optional, Tuple
+import base64
+import binascii
+import json
+import logging
+import os
+import re
+
+logger = logging.getLogger(__name__)
+
+# Search configuration
+SNIPPET_LENGTH = int(os.environ.get("SEARCH_SNIPPET_LENGTH", "160"))
+SEARCH_BACKFILL_BATCH_SIZE = 500
+# Marks the one-off indexing of content written before search existed; v2 also
+# re-indexes entries that v1 wrote without a couple_id
+SEARCH_BACKFILL_MARKER = "search_entries_v2"
+
+WORD = re.compile(r"\w+", re.UNICODE)
+
+# search_entries holds one document per searchable letter or answer, carrying
+# a text index prefixed by couple_id so every search reads one couple's slice
+
+def letter_entry(letter: dict) -> dict:
+    return {
+        "id": letter["id"],
+        "kind": "letter",
+        "couple_id": letter.get("couple_id"),
+        "user_ids": [letter["from_user_id"], letter["to_user_id"]],
+        "author_id": letter["from_user_id"],
+        "title": letter["title"],
+        "text": letter["content"],
+        "created_at": letter["created_at"],
+    }
+
+def answer_entry(answer: dict) -> dict:
+    return {
+        "id": answer["id"],
+        "kind": "answer",
+        "couple_id": answer.get("couple_id"),
+        "user_ids": [answer["user_id"]],
+        "author_id": answer["user_id"],
+        "question_id": answer["question_id"],
+        "text": answer["answer_text"],
+        "created_at": answer["created_at"],
+    }
+
+# Searchable collections and how each document becomes a search entry
+SEARCH_SOURCES = {"letters": letter_entry, "answers": answer_entry}
+
+async def write_entry(db: AsyncIOMotorDatabase, entry: dict):
+    # An entry without a couple would match every search by a user without one;
+    # the couple_id migration indexes the content once it has a couple
+    if not entry["couple_id"]:
+        return
+    await db.search_entries.update_one({"id": entry["id"]}, {"$set": entry}, upsert=True)
+
+async def index_letter(db: AsyncIOMotorDatabase, letter: dict):
+    """Add or refresh a letter's search entry"""
+    await write_entry(db, letter_entry(letter))
+
+async def index_answer(db: AsyncIOMotorDatabase, answer: dict):
+    """Add or refresh an answer's search entry"""
+    await write_entry(db, answer_entry(answer))
+
+async def index_documents(db: AsyncIOMotorDatabase, collection: str, ids: List[str]):
+    """Refresh the search entries of these letters or answers from their current state"""
+    make_entry = SEARCH_SOURCES[collection]
+    operations = [
+        UpdateOne({"id": doc["id"]}, {"$set": make_entry(doc)}, upsert=True)
+        async for doc in db[collection].find({"id": {"$in": ids}}, {"_id": 0})
+        if doc.get("couple_id")
+    ]
+    await write_entries(db, operations)
+
+async def unindex(db: AsyncIOMotorDatabase, doc_id: str):
+    """Remove a deleted document's search entry"""
+    await db.search_entries.delete_one({"id": doc_id})
+
+def search_terms(q: str) -> List[str]:
+    return [term.lower() for term in WORD.findall(q)]
+
+def make_snippet(text: str, terms: List[str], length: int = SNIPPET_LENGTH) -> Tuple[str, List[List[int]]]:
+    """Cut a window of text around the first matched word and locate every match in it
+
+    The text index stems words, so a word matches when it starts with a
+    term or a term starts with it ("travel" finds "travelling").
+    """
+    matches = [
+        (match.start(), match.end()) for match in WORD.finditer(text)
+        if any(word_matches(match.group().lower(), term) for term in terms)
+    ]
+
+    start = 0
+    if matches and matches[0][1] > length:
+        start = max(0, matches[0][0] - length // 4)
+        # Don't cut a word in half
+        while start > 0 and not text[start - 1].isspace():
+            start -= 1
+    end = min(len(text), start + length)
+    while end < len(text) and not text[end].isspace() and end - start < length + 20:
+        end += 1
+
+    prefix = "…" if start > 0 else ""
+    suffix = "…" if end < len(text) else ""
+    snippet = prefix + text[start:end] + suffix
+    highlights = [
+        [match_start - start + len(prefix), match_end - start + len(prefix)]
+        for match_start, match_end in matches
+        if match_start >= start and match_end <= end
+    ]
+    return snippet, highlights
+
+def word_matches(word: str, term: str) -> bool:
+    stem = term[:max(3, len(term) - 2)]
+    return word.startswith(stem) or (len(word) >= 3 and term.startswith(word))
+
+def encode_offset(offset: int) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"offset": offset}).encode()).decode()
+
+def decode_offset(cursor: str) -> int:
+    try:
+        offset = json.loads(base64.urlsafe_b64decode(cursor.encode()))["offset"]
+        if not isinstance(offset, int) or offset < 0:
+            raise ValueError(offset)
+        return offset
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+async def search_couple(
+    db: AsyncIOMotorDatabase,
+    couple_id: str,
+    q: str,
+    limit: int,
+    cursor: Optional[str] = None
+) -> Tuple[List[dict], Optional[str]]:
+    """Rank a couple's letters and answers against a query, best match first"""
+    if not couple_id:
+        return [], None
+    offset = decode_offset(cursor) if cursor else 0
+    score = {"$meta": "textScore"}
+
+    # Results are ordered by relevance, so pages are cut by offset rather than by key
+    entries = await db.search_entries.find(
+        {"couple_id": couple_id, "$text": {"$search": q}},
+        {"_id": 0, "user_ids": 0, "couple_id": 0, "score": score}
+    ).sort([("score", score), ("created_at", -1)]).skip(offset).limit(limit + 1).to_list(limit + 1)
+
+    next_cursor = None
+    if len(entries) > limit:
+        entries = entries[:limit]
+        next_cursor = encode_offset(offset + limit)
+
+    terms = search_terms(q)
+    results = []
+    for entry in entries:
+        snippet, highlights = make_snippet(entry.pop("text"), terms)
+        results.append({**entry, "snippet": snippet, "highlights": highlights})
+    return results, next_cursor
+
+async def write_entries(db: AsyncIOMotorDatabase, operations: List[UpdateOne]) -> int:
+    """Apply search entry upserts, tolerating another worker upserting the same entries"""
+    if not operations:
+        return 0
+    try:
+        result = await db.search_entries.bulk_write(operations, ordered=False)
+        return result.upserted_count
+    except BulkWriteError as e:
+        if any(error["code"] != 11000 for error in e.details["writeErrors"]):
+            raise
+        return e.details["nUpserted"]
+
+async def backfill_search_index(db: AsyncIOMotorDatabase):
+    """Index letters and answers written before search existed, once"""
+    if await db.schema_migrations.find_one({"_id": SEARCH_BACKFILL_MARKER}):
+        return
+
+    # Entries written without a couple_id match no couple's search; rebuild them below
+    await db.search_entries.delete_many({"couple_id": None})
+
+    # Content from before couple_id existed takes its author's couple_id
+    couple_ids = {}
+    async def couple_id_of(user_id: str) -> Optional[str]:
+        # Users still waiting for a couple_id are looked up again next time
+        if user_id not in couple_ids:
+            user = await db.users.find_one({"id": user_id}, {"_id": 0, "couple_id": 1})
+            if not (user or {}).get("couple_id"):
+                return None
+            couple_ids[user_id] = user["couple_id"]
+        return couple_ids[user_id]
+
+    indexed = 0
+    owner_fields = {"letters": "from_user_id", "answers": "user_id"}
+    for collection, make_entry in SEARCH_SOURCES.items():
+        operations = []
+        async for doc in db[collection].find({}, {"_id": 0}).batch_size(SEARCH_BACKFILL_BATCH_SIZE):
+            entry = make_entry(doc)
+            entry["couple_id"] = entry["couple_id"] or await couple_id_of(doc[owner_fields[collection]])
+            if not entry["couple_id"]:
+                # Indexed by the couple_id migration once the author has a couple
+                continue
+            # Never overwrite an entry the routers wrote meanwhile
+            operations.append(UpdateOne({"id": entry["id"]}, {"$setOnInsert": entry}, upsert=True))
+            if len(operations) >= SEARCH_BACKFILL_BATCH_SIZE:
+                indexed += await write_entries(db, operations)
+                operations = []
+        indexed += await write_entries(db, operations)
+
+    await db.schema_migrations.update_one(
+        {"_id": SEARCH_BACKFILL_MARKER}, {"$set": {"done": True}}, upsert=True
+    )
+    logger.info("Indexed %d existing letters and answers for search", indexed)
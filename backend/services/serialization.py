@@ -0,0 +1,37 @@
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from typing import Any, Iterable, List, Optional, Type, TypeVar
+import orjson
+
+from models.pagination import Page
+
+M = TypeVar("M", bound=BaseModel)
+
+def _default(value: Any):
+    """Serialize models built with model_construct straight from their field values"""
+    if isinstance(value, BaseModel):
+        return value.__dict__
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+class FastJSONResponse(JSONResponse):
+    """JSON response rendered by orjson
+
+    Returning one of these from a handler also skips FastAPI's second
+    validation pass against response_model.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+def from_doc(model: Type[M], doc: dict) -> M:
+    """Build a response model from a trusted database row without validating it"""
+    return model.model_construct(**doc)
+
+def from_docs(model: Type[M], docs: Iterable[dict]) -> List[M]:
+    """Build response models from trusted database rows without validating them"""
+    construct = model.model_construct
+    return [construct(**doc) for doc in docs]
+
+def page_of(model: Type[M], docs: Iterable[dict], next_cursor: Optional[str]) -> Page:
+    """Build a page of response models from trusted database rows"""
+    return Page[model].model_construct(items=from_docs(model, docs), next_cursor=next_cursor)
@@ -0,0 +1,149 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import AsyncIterator, Awaitable, Callable, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import DuplicateKeyError
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Blob storage configuration
+BLOB_STORAGE_BACKEND = os.environ.get("BLOB_STORAGE_BACKEND", "local")
+CHUNK_SIZE = 1024 * 1024  # 1 MB
+# Released blobs are only deleted after this long without a new reference
+BLOB_SWEEP_GRACE = timedelta(seconds=int(os.environ.get("BLOB_SWEEP_GRACE_SECONDS", str(60 * 60))))
+BLOB_SWEEP_INTERVAL = int(os.environ.get("BLOB_SWEEP_INTERVAL_SECONDS", str(10 * 60)))
+# A sweeper that holds a blob longer than this is assumed to have died
+BLOB_DELETE_LEASE = timedelta(minutes=5)
+BLOB_RETAIN_RETRY_SECONDS = 0.05
+
+# Called with a blob's key once it is hashed, before it is deduplicated
+ClaimHook = Callable[[str], Awaitable[None]]
+
+@dataclass
+class StoredBlob:
+    key: str
+    size: int
+
+class BlobStore(ABC):
+    """Content-addressed storage for photo bytes, keyed by SHA-256 digest"""
+
+    @abstractmethod
+    async def put(self, chunks: AsyncIterator[bytes], claim: Optional[ClaimHook] = None) -> StoredBlob:
+        """Hash and store a stream of bytes, writing each distinct blob only once"""
+
+    @abstractmethod
+    def stream(self, key: str, start: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Stream the bytes of a stored blob, optionally limited to a byte range"""
+
+    @abstractmethod
+    async def exists(self, key: str) -> bool:
+        """Check whether a blob is stored"""
+
+    @abstractmethod
+    async def delete(self, key: str) -> None:
+        """Delete a stored blob"""
+
+_store = None
+
+def get_blob_store(db: AsyncIOMotorDatabase) -> BlobStore:
+    """Get the configured blob store"""
+    global _store
+    if _store is None:
+        if BLOB_STORAGE_BACKEND == "gridfs":
+            from storage.gridfs_store import GridFSBlobStore
+            _store = GridFSBlobStore(db)
+        elif BLOB_STORAGE_BACKEND == "local":
+            from storage.local_store import LocalBlobStore
+            _store = LocalBlobStore()
+        else:
+            raise ValueError(f"Unknown blob storage backend: {BLOB_STORAGE_BACKEND}")
+    return _store
+
+PHOTO_BLOB_FIELDS = [
+    "blob_key",
+    "derivatives.original.blob_key",
+    "derivatives.medium.blob_key",
+    "derivatives.thumbnail.blob_key",
+]
+
+# blobs holds a reference count per blob key: {_id: key, refs, released_at, deleting_at}.
+# Uploads take their reference before deduplicating against a stored copy,
+# and deletion happens in a delayed sweep, never inline.
+
+async def retain_blob(db: AsyncIOMotorDatabase, key: str):
+    """Take a reference on a blob, waiting out a sweep that is deleting it"""
+    while True:
+        lease_expired = datetime.utcnow() - BLOB_DELETE_LEASE
+        try:
+            await db.blobs.update_one(
+                {"_id": key, "$or": [{"deleting_at": None}, {"deleting_at": {"$lt": lease_expired}}]},
+                {"$inc": {"refs": 1}, "$unset": {"released_at": "", "deleting_at": ""}},
+                upsert=True
+            )
+            return
+        except DuplicateKeyError:
+            # The sweep holds the key; once it finishes the blob is stored afresh
+            await asyncio.sleep(BLOB_RETAIN_RETRY_SECONDS)
+
+async def store_photo_blob(db: AsyncIOMotorDatabase, chunks: AsyncIterator[bytes]) -> StoredBlob:
+    """Store photo bytes holding a reference on the blob, so no sweep can delete it under us"""
+    return await get_blob_store(db).put(chunks, claim=lambda key: retain_blob(db, key))
+
+async def release_photo_blob(db: AsyncIOMotorDatabase, key: str) -> None:
+    """Drop a reference on a blob; the sweep deletes it after the grace period"""
+    # Blobs stored before reference counting have no count yet, so theirs may go negative
+    await db.blobs.update_one(
+        {"_id": key},
+        {"$inc": {"refs": -1}, "$set": {"released_at": datetime.utcnow()}},
+        upsert=True
+    )
+
+async def sweep_released_blobs(db: AsyncIOMotorDatabase) -> int:
+    """Delete blobs that have had no references for the whole grace period"""
+    now = datetime.utcnow()
+    cutoff = now - BLOB_SWEEP_GRACE
+    released = {"refs": {"$lte": 0}, "released_at": {"$lt": cutoff}}
+    swept = 0
+    async for blob in db.blobs.find(released, {"_id": 1}):
+        key = blob["_id"]
+        # Claim the key; uploads retaining it wait until the claim is gone
+        claimed = await db.blobs.update_one(
+            {"_id": key, **released, "$or": [
+                {"deleting_at": None}, {"deleting_at": {"$lt": now - BLOB_DELETE_LEASE}}
+            ]},
+            {"$set": {"deleting_at": now}}
+        )
+        if not claimed.modified_count:
+            continue
+
+        # Counts for blobs stored before reference counting can be off, so check the photos too
+        in_use = await db.photos.find_one(
+            {"$or": [{field: key} for field in PHOTO_BLOB_FIELDS]},
+            {"_id": 1}
+        )
+        if in_use:
+            await db.blobs.update_one(
+                {"_id": key, "deleting_at": now},
+                {"$unset": {"released_at": "", "deleting_at": ""}}
+            )
+            continue
+
+        await get_blob_store(db).delete(key)
+        await db.blobs.delete_one({"_id": key, "deleting_at": now})
+        swept += 1
+    return swept
+
+async def run_blob_sweep(db: AsyncIOMotorDatabase, interval: int = BLOB_SWEEP_INTERVAL):
+    """Sweep released blobs on every interval"""
+    while True:
+        try:
+            swept = await sweep_released_blobs(db)
+            if swept:
+                logger.info("Deleted %d unreferenced blobs", swept)
+        except Exception:
+            logger.exception("Error sweeping released blobs")
+        await asyncio.sleep(interval)
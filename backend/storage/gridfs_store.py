@@ -0,0 +1,67 @@
+from typing import AsyncIterator, Optional
+from motor.motor_asyncio import AsyncIOMotorDatabase, AsyncIOMotorGridFSBucket
+import hashlib
+import uuid
+
+from storage.blob_store import BlobStore, ClaimHook, StoredBlob, CHUNK_SIZE
+
+GRIDFS_BUCKET_NAME = "photo_blobs"
+
+class GridFSBlobStore(BlobStore):
+    """Blob store backed by MongoDB GridFS"""
+
+    def __init__(self, db: AsyncIOMotorDatabase, bucket_name: str = GRIDFS_BUCKET_NAME):
+        self.bucket = AsyncIOMotorGridFSBucket(db, bucket_name=bucket_name, chunk_size_bytes=CHUNK_SIZE)
+        self.files = db[f"{bucket_name}.files"]
+
+    async def put(self, chunks: AsyncIterator[bytes], claim: Optional[ClaimHook] = None) -> StoredBlob:
+        """Stream bytes into GridFS under a temp name, then rename it to its digest"""
+        digest = hashlib.sha256()
+        size = 0
+
+        grid_in = self.bucket.open_upload_stream(f"tmp-{uuid.uuid4()}")
+        try:
+            async for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                await grid_in.write(chunk)
+        except BaseException:
+            await grid_in.abort()
+            raise
+        await grid_in.close()
+
+        key = digest.hexdigest()
+        if claim is not None:
+            await claim(key)
+
+        # Identical content is already stored, so drop the new copy
+        if await self.exists(key):
+            await self.bucket.delete(grid_in._id)
+        else:
+            await self.bucket.rename(grid_in._id, key)
+
+        return StoredBlob(key=key, size=size)
+
+    async def stream(self, key: str, start: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Stream the blob out of GridFS chunk by chunk"""
+        grid_out = await self.bucket.open_download_stream_by_name(key)
+        if start:
+            grid_out.seek(start)
+        remaining = length
+        while remaining is None or remaining > 0:
+            size = CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining)
+            chunk = await grid_out.read(size)
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+    async def exists(self, key: str) -> bool:
+        """Check whether a file with this digest is stored"""
+        return await self.files.find_one({"filename": key}, {"_id": 1}) is not None
+
+    async def delete(self, key: str) -> None:
+        """Delete every GridFS file stored under this digest"""
+        async for file_doc in self.files.find({"filename": key}, {"_id": 1}):
+            await self.bucket.delete(file_doc["_id"])
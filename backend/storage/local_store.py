@@ -0,0 +1,82 @@
+from pathlib import Path
+from typing import AsyncIterator, Optional
+import asyncio
+import hashlib
+import os
+import uuid
+
+from storage.blob_store import BlobStore, ClaimHook, StoredBlob, CHUNK_SIZE
+
+BLOB_STORAGE_DIR = os.environ.get(
+    "BLOB_STORAGE_DIR", str(Path(__file__).parent.parent / "uploads")
+)
+
+class LocalBlobStore(BlobStore):
+    """Blob store backed by the local filesystem"""
+
+    def __init__(self, root: str = BLOB_STORAGE_DIR):
+        self.root = Path(root)
+        self.tmp_dir = self.root / "tmp"
+        self.tmp_dir.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, key: str) -> Path:
+        # Fan out into sub-directories so no single directory grows too large
+        return self.root / key[:2] / key[2:4] / key
+
+    async def put(self, chunks: AsyncIterator[bytes], claim: Optional[ClaimHook] = None) -> StoredBlob:
+        """Stream bytes into a temp file, then move it into place by digest"""
+        digest = hashlib.sha256()
+        size = 0
+        tmp_path = self.tmp_dir / str(uuid.uuid4())
+
+        f = await asyncio.to_thread(open, tmp_path, "wb")
+        try:
+            async for chunk in chunks:
+                digest.update(chunk)
+                size += len(chunk)
+                await asyncio.to_thread(f.write, chunk)
+        except BaseException:
+            await asyncio.to_thread(f.close)
+            tmp_path.unlink(missing_ok=True)
+            raise
+        await asyncio.to_thread(f.close)
+
+        key = digest.hexdigest()
+        if claim is not None:
+            await claim(key)
+        final_path = self._path(key)
+
+        # Identical content is already stored, so keep the existing copy
+        if final_path.exists():
+            tmp_path.unlink(missing_ok=True)
+        else:
+            final_path.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_path, final_path)
+
+        return StoredBlob(key=key, size=size)
+
+    async def stream(self, key: str, start: int = 0, length: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Stream the blob from disk in fixed-size chunks"""
+        f = await asyncio.to_thread(open, self._path(key), "rb")
+        try:
+            if start:
+                await asyncio.to_thread(f.seek, start)
+            remaining = length
+            while remaining is None or remaining > 0:
+                size = CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining)
+                chunk = await asyncio.to_thread(f.read, size)
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+        finally:
+            await asyncio.to_thread(f.close)
+
+    async def exists(self, key: str) -> bool:
+        """Check whether the blob file exists"""
+        return self._path(key).exists()
+
+    async def delete(self, key: str) -> None:
+        """Remove the blob file"""
+        self._path(key).unlink(missing_ok=True)
@@ -0,0 +1,5 @@
+from pathlib import Path
+import sys
+
+# The backend is run from its own directory, so its modules import top-level
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
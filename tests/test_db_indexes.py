@@ -0,0 +1,82 @@
+from pathlib import Path
+import ast
+import asyncio
+
+import pytest
+from pymongo.errors import OperationFailure
+
+from services.db_indexes import INDEXES, ROUTER_QUERIES, ensure_indexes
+
+ROUTERS_DIR = Path(__file__).resolve().parent.parent / "backend" / "routers"
+
+# Collection methods that read or match documents, so their filters need an index
+QUERY_METHODS = {
+    "find", "find_one", "find_one_and_update", "find_one_and_delete", "update_one",
+    "update_many", "delete_one", "delete_many", "count_documents", "distinct", "aggregate",
+}
+QUERY_HELPERS = {"paginate", "read_collection"}
+
+def issues_query(function: ast.AST) -> bool:
+    """Whether a function queries the database itself, as db.<collection>.<method> or through a helper"""
+    for node in ast.walk(function):
+        if not isinstance(node, ast.Call):
+            continue
+        if isinstance(node.func, ast.Name) and node.func.id in QUERY_HELPERS:
+            return True
+        if isinstance(node.func, ast.Attribute) and node.func.attr in QUERY_METHODS:
+            target = node.func.value
+            if isinstance(target, ast.Attribute) and isinstance(target.value, ast.Name) and target.value.id == "db":
+                return True
+    return False
+
+def router_queries():
+    for path in sorted(ROUTERS_DIR.glob("*.py")):
+        for node in ast.parse(path.read_text()).body:
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and issues_query(node):
+                yield f"{path.stem}.{node.name}"
+
+CATALOGUED = {query["name"].split(" ")[0] for query in ROUTER_QUERIES}
+
+@pytest.mark.parametrize("name", list(router_queries()))
+def test_router_query_is_catalogued(name):
+    assert name in CATALOGUED, f"{name} queries the database but has no entry in ROUTER_QUERIES"
+
+def test_catalogued_collections_have_indexes():
+    for query in ROUTER_QUERIES:
+        collection = query.get("find") or query.get("count")
+        assert collection in INDEXES, f"{query['name']} queries {collection}, which declares no indexes"
+
+class FailingCollection:
+    def __init__(self, failures, name):
+        self.failures = failures
+        self.name = name
+
+    async def create_indexes(self, indexes):
+        if self.name in self.failures:
+            raise self.failures[self.name]
+        return [f"{self.name}_{index}" for index, _ in enumerate(indexes)]
+
+class FailingDatabase:
+    """Stands in for a database whose index builds fail on some collections"""
+
+    def __init__(self, failures):
+        self.failures = failures
+
+    def __getitem__(self, name):
+        return FailingCollection(self.failures, name)
+
+@pytest.mark.parametrize("collection, code", [
+    ("users", 11000),  # duplicate usernames
+    ("events", 85),  # TTL changed on an existing index
+    ("events", 86),
+    ("mood_rollups", 67),  # any failure on a collection with a unique index
+])
+def test_ensure_indexes_fails_loudly(collection, code):
+    db = FailingDatabase({collection: OperationFailure("index build failed", code=code)})
+    with pytest.raises(OperationFailure):
+        asyncio.run(ensure_indexes(db))
+
+def test_ensure_indexes_tolerates_other_failures():
+    # A non-unique index that can't be built only costs performance
+    db = FailingDatabase({"blobs": OperationFailure("index build failed", code=67)})
+    asyncio.run(ensure_indexes(db))
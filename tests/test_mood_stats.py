@@ -0,0 +1,139 @@
+from datetime import date, datetime, timedelta
+import asyncio
+
+import numpy as np
+import pytest
+from mongomock_motor import AsyncMongoMockClient
+
+from services.mood_rollups import MOOD_ROLLUP_MARKER, record_mood, sync_mood_rollups
+from services.mood_stats import compute_mood_stats, run_lengths
+
+START = date(2024, 3, 1)
+END = date(2024, 3, 10)
+
+def rollup(user_id, day, moods, emojis=None):
+    return {"user_id": user_id, "day": day.isoformat(), "moods": moods, "emojis": emojis or {}}
+
+@pytest.mark.parametrize("active, longest, current", [
+    ([], 0, 0),
+    ([0, 0, 0], 0, 0),
+    ([1], 1, 1),
+    ([0, 0, 1], 1, 1),
+    ([0, 1, 0], 1, 1),  # a streak survives until a whole day passes without a mood
+    ([1, 0, 0], 1, 0),
+    ([1, 1, 0, 1, 1, 1, 0, 0], 3, 0),
+    ([1, 1, 1, 0, 1], 3, 1),
+])
+def test_run_lengths(active, longest, current):
+    assert run_lengths(np.array(active, dtype=bool)) == (longest, current)
+
+def test_empty_range():
+    stats = compute_mood_stats([], ["a", "b"], START, END)
+
+    assert len(stats["days"]) == 10
+    for user in stats["users"]:
+        assert user["total"] == 0
+        assert user["active_days"] == 0
+        assert user["current_streak"] == user["longest_streak"] == 0
+        assert user["distribution"] == {}
+        assert user["daily_totals"] == [0] * 10
+        assert user["daily_moods"] == [None] * 10
+    assert stats["alignment"]["shared_days"] == 0
+    assert stats["alignment"]["agreement"] is None
+    assert stats["alignment"]["similarity"] is None
+
+def test_single_day_range():
+    stats = compute_mood_stats([rollup("a", END, {"happy": 2})], ["a"], END, END)
+
+    (user,) = stats["users"]
+    assert stats["days"] == [END.isoformat()]
+    assert user["current_streak"] == user["longest_streak"] == 1
+    assert user["distribution"] == {"happy": 1.0}
+    assert stats["alignment"] is None
+
+def test_gaps_distribution_and_dominant_mood():
+    rollups = [
+        rollup("a", START, {"happy": 1}, {"😀": 1}),
+        rollup("a", START + timedelta(days=1), {"happy": 1, "sad": 2}, {"😢": 3}),
+        rollup("a", START + timedelta(days=4), {"calm": 1}),
+        # Outside the range, so ignored
+        rollup("a", START - timedelta(days=1), {"angry": 5}),
+    ]
+    (user,) = compute_mood_stats(rollups, ["a"], START, END)["users"]
+
+    assert user["total"] == 5
+    assert user["active_days"] == 3
+    assert user["longest_streak"] == 2
+    assert user["current_streak"] == 0
+    assert user["distribution"] == {"calm": 0.2, "happy": 0.4, "sad": 0.4}
+    assert user["top_emojis"][0] == "😢"
+    assert user["daily_totals"][:5] == [1, 3, 0, 0, 1]
+    assert user["daily_moods"][:5] == ["happy", "sad", None, None, "calm"]
+
+def test_encoded_mood_keys_are_decoded():
+    (user,) = compute_mood_stats([rollup("a", END, {"so%2Eso%24": 1})], ["a"], START, END)["users"]
+    assert user["distribution"] == {"so.so$": 1.0}
+
+def test_partner_alignment():
+    rollups = [
+        rollup("a", END - timedelta(days=2), {"happy": 1}),
+        rollup("b", END - timedelta(days=2), {"happy": 1}),
+        rollup("a", END - timedelta(days=1), {"happy": 1}),
+        rollup("b", END - timedelta(days=1), {"sad": 1}),
+        rollup("a", END, {"happy": 1}),
+    ]
+    alignment = compute_mood_stats(rollups, ["a", "b"], START, END)["alignment"]
+
+    assert alignment["shared_days"] == 2
+    assert alignment["same_mood_days"] == 1
+    assert alignment["agreement"] == 0.5
+    assert alignment["similarity"] == pytest.approx(0.5)
+    assert alignment["longest_streak"] == 2
+    assert alignment["current_streak"] == 2
+
+def mood(user_id, created_at, name="happy"):
+    return {"user_id": user_id, "mood": name, "emoji": "😀", "note": "", "created_at": created_at}
+
+def test_rebuild_waits_out_the_grace_period_after_midnight():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        before_midnight = datetime(2024, 3, 1, 23, 59, 59)
+        late = mood("a", before_midnight)
+        await db.moods.insert_one(dict(late))
+
+        # Just after midnight the day is still open to late increments
+        await sync_mood_rollups(db, now=datetime(2024, 3, 2, 0, 0, 1))
+        assert await db.mood_rollups.count_documents({}) == 0
+
+        # The increment for the late mood lands after midnight
+        await record_mood(db, late)
+
+        await sync_mood_rollups(db, now=datetime(2024, 3, 2, 1, 30))
+        rebuilt = await db.mood_rollups.find_one({"user_id": "a", "day": "2024-03-01"})
+        assert rebuilt["total"] == 1
+        assert rebuilt["moods"] == {"happy": 1}
+    asyncio.run(run())
+
+def test_only_the_lease_holder_rebuilds():
+    async def run():
+        db = AsyncMongoMockClient()["test"]
+        await db.moods.insert_one(mood("a", datetime(2024, 3, 1, 12)))
+        now = datetime(2024, 3, 3)
+
+        # Another worker is mid-rebuild
+        await db.schema_migrations.insert_one({
+            "_id": MOOD_ROLLUP_MARKER, "lease_until": datetime.utcnow() + timedelta(minutes=1)
+        })
+        await sync_mood_rollups(db, now=now)
+        assert await db.mood_rollups.count_documents({}) == 0
+
+        # Its lease ran out without it finishing
+        await db.schema_migrations.update_one(
+            {"_id": MOOD_ROLLUP_MARKER}, {"$set": {"lease_until": datetime.utcnow() - timedelta(minutes=1)}}
+        )
+        await sync_mood_rollups(db, now=now)
+        assert await db.mood_rollups.count_documents({}) == 1
+        marker = await db.schema_migrations.find_one({"_id": MOOD_ROLLUP_MARKER})
+        assert marker["through"] == datetime(2024, 3, 2)
+        assert "lease_until" not in marker
+    asyncio.run(run())
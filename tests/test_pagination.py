@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta
+import asyncio
+import base64
+import json
+
+import pytest
+from fastapi import HTTPException
+from mongomock_motor import AsyncMongoMockClient
+
+from services.pagination import decode_cursor, encode_cursor, paginate
+
+START = datetime(2024, 1, 1, 12, 0, 0)
+
+def make_docs(count):
+    # Pairs share a timestamp, so ties are broken by id
+    return [{"id": f"doc-{index:03d}", "created_at": START + timedelta(minutes=index // 2)} for index in range(count)]
+
+def fetch(docs, limit, cursor=None):
+    async def run():
+        collection = AsyncMongoMockClient()["test"]["docs"]
+        if docs:
+            await collection.insert_many([dict(doc) for doc in docs])
+        return await paginate(collection, {}, limit, cursor, {"_id": 0})
+    return asyncio.run(run())
+
+def test_cursor_round_trip():
+    doc = {"id": "abc", "created_at": datetime(2024, 5, 6, 7, 8, 9, 123000)}
+    assert decode_cursor(encode_cursor(doc)) == (doc["created_at"], "abc")
+
+@pytest.mark.parametrize("cursor", [
+    "not base64!",
+    base64.urlsafe_b64encode(b"not json").decode(),
+    base64.urlsafe_b64encode(json.dumps({"id": "abc"}).encode()).decode(),
+    base64.urlsafe_b64encode(json.dumps({"created_at": "yesterday", "id": "abc"}).encode()).decode(),
+    base64.urlsafe_b64encode(json.dumps(["2024-01-01T00:00:00", "abc"]).encode()).decode(),
+    encode_cursor({"id": "abc", "created_at": START})[:-4],
+])
+def test_tampered_cursor_is_rejected(cursor):
+    with pytest.raises(HTTPException) as excinfo:
+        decode_cursor(cursor)
+    assert excinfo.value.status_code == 400
+
+@pytest.mark.parametrize("count, limit, has_next", [
+    (0, 5, False),
+    (4, 5, False),
+    (5, 5, False),
+    (6, 5, True),
+])
+def test_next_cursor_only_when_more_than_limit(count, limit, has_next):
+    docs, next_cursor = fetch(make_docs(count), limit)
+    assert len(docs) == min(count, limit)
+    assert (next_cursor is not None) is has_next
+
+def test_pages_cover_every_document_once_newest_first():
+    docs = make_docs(11)
+    seen, cursor = [], None
+    while True:
+        page, cursor = fetch(docs, 3, cursor)
+        seen += [doc["id"] for doc in page]
+        if cursor is None:
+            break
+
+    expected = sorted(docs, key=lambda doc: (doc["created_at"], doc["id"]), reverse=True)
+    assert seen == [doc["id"] for doc in expected]
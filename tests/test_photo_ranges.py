@@ -0,0 +1,53 @@
+import pytest
+
+from routers.photos import RangeNotSatisfiable, etag_matches, parse_range
+
+SIZE = 100
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", (0, 9)),
+    ("bytes=10-", (10, 99)),
+    ("bytes=90-200", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+    ("bytes=99-99", (99, 99)),
+    ("Bytes=0-0", (0, 0)),
+])
+def test_parse_range_satisfiable(header, expected):
+    assert parse_range(header, SIZE) == expected
+
+@pytest.mark.parametrize("header", [
+    "items=0-5",
+    "bytes=abc",
+    "bytes=9-3",
+    "bytes=0-9,20-30",
+    "bytes=-",
+    "bytes=+1-2",
+    "bytes=0-9-",
+])
+def test_parse_range_ignored(header):
+    assert parse_range(header, SIZE) is None
+
+@pytest.mark.parametrize("header, size", [
+    ("bytes=100-", SIZE),
+    ("bytes=150-200", SIZE),
+    ("bytes=-0", SIZE),
+    ("bytes=0-", 0),
+    ("bytes=-5", 0),
+])
+def test_parse_range_unsatisfiable(header, size):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, size)
+
+@pytest.mark.parametrize("if_none_match, matches", [
+    (None, False),
+    ("", False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"other", "abc"', True),
+    ("*", True),
+    ('"abcd"', False),
+    ("abc", False),
+])
+def test_etag_matches(if_none_match, matches):
+    assert etag_matches(if_none_match, '"abc"') is matches
@@ -0,0 +1,130 @@
+import asyncio
+import ipaddress
+
+import httpx
+import pytest
+
+import services.rate_limit as rate_limit
+from middleware.rate_limit_middleware import RateLimitMiddleware
+from services.rate_limit import LimitPolicy, RateLimiter, TokenBuckets, client_ip, parse_networks, route_group
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+def test_bucket_allows_burst_then_refills(clock):
+    buckets = TokenBuckets()
+    key = ("reads", "ip", "1.2.3.4")
+    # 60 per minute is one token a second
+    assert [buckets.take(key, 60, 3) for _ in range(3)] == [0, 0, 0]
+    assert buckets.take(key, 60, 3) == pytest.approx(1.0)
+
+    clock.now += 2.5
+    assert buckets.take(key, 60, 3) == 0
+    assert buckets.take(key, 60, 3) == 0
+    assert buckets.take(key, 60, 3) == pytest.approx(0.5)
+
+def test_bucket_never_refills_past_burst(clock):
+    buckets = TokenBuckets()
+    key = ("reads", "ip", "1.2.3.4")
+    buckets.take(key, 60, 2)
+    clock.now += 3600
+    assert [buckets.take(key, 60, 2) for _ in range(3)][-1] > 0
+
+def test_bucket_evicts_least_recently_used(clock):
+    buckets = TokenBuckets(max_size=2)
+    for ip in ("a", "b", "c"):
+        buckets.take(("reads", "ip", ip), 60, 1)
+    assert len(buckets) == 2
+    # The evicted bucket comes back full
+    assert buckets.take(("reads", "ip", "a"), 60, 1) == 0
+
+def limiter(**fields):
+    policy = dict(ip_per_minute=60.0, ip_burst=1, user_per_minute=6.0, user_burst=1, concurrency=2, max_body=1024)
+    policy.update(fields)
+    return RateLimiter({"writes": LimitPolicy(**policy)})
+
+def test_retry_after_is_rounded_up(clock):
+    limits = limiter(ip_per_minute=7.0)
+    assert limits.check("writes", "ip", None) is None
+    # A token every 60/7 = 8.57 seconds
+    assert limits.check("writes", "ip", None) == ("ip", 9)
+
+def test_user_bucket_is_separate_from_ip_bucket(clock):
+    limits = limiter(ip_burst=10)
+    assert limits.check("writes", "1.1.1.1", "user-1") is None
+    assert limits.check("writes", "2.2.2.2", "user-1") == ("user", 10)
+    assert limits.check("writes", "2.2.2.2", "user-2") is None
+
+def test_zero_rate_disables_a_bucket(clock):
+    limits = limiter(ip_per_minute=0.0, user_per_minute=0.0)
+    for _ in range(5):
+        assert limits.check("writes", "ip", "user") is None
+
+def test_concurrency_cap(clock):
+    limits = limiter(ip_burst=10, user_burst=10)
+    limits.acquire("writes")
+    limits.acquire("writes")
+    assert limits.check("writes", "ip", None) == ("concurrency", 1)
+    limits.release("writes")
+    assert limits.check("writes", "ip", None) is None
+
+TRUSTED = parse_networks("127.0.0.1/32, 10.0.0.0/8, ::1/128")
+
+@pytest.mark.parametrize("peer, forwarded_for, expected", [
+    ("203.0.113.7", None, "203.0.113.7"),
+    # Only trusted proxies may speak for the client
+    ("203.0.113.7", "198.51.100.1", "203.0.113.7"),
+    ("127.0.0.1", "198.51.100.1", "198.51.100.1"),
+    # The right-most untrusted hop wins over anything the client put further left
+    ("127.0.0.1", "6.6.6.6, 198.51.100.1", "198.51.100.1"),
+    ("127.0.0.1", "6.6.6.6, 198.51.100.1, 10.1.2.3", "198.51.100.1"),
+    ("127.0.0.1", "10.1.2.3, 10.4.5.6", "10.1.2.3"),
+    ("127.0.0.1", "garbage", "garbage"),
+    ("127.0.0.1", "", "127.0.0.1"),
+    ("::1", "2001:db8::1", "2001:db8::1"),
+    (None, "198.51.100.1", "unknown"),
+])
+def test_client_ip(peer, forwarded_for, expected):
+    assert client_ip(peer, forwarded_for, TRUSTED) == expected
+
+def test_parse_networks():
+    assert parse_networks("") == []
+    assert parse_networks("10.1.2.3/8") == [ipaddress.ip_network("10.0.0.0/8")]
+
+@pytest.mark.parametrize("method, path, group", [
+    ("POST", "/api/auth/login", "auth"),
+    ("POST", "/api/auth/register", "auth"),
+    ("POST", "/api/photos", "uploads"),
+    ("POST", "/api/photos/batch", "uploads"),
+    ("GET", "/api/photos", "reads"),
+    ("DELETE", "/api/photos/abc", "writes"),
+    ("POST", "/api/letters", "writes"),
+    ("GET", "/api/events/stream", None),
+    ("GET", "/metrics", None),
+])
+def test_route_group(method, path, group):
+    assert route_group(method, path) == group
+
+async def accept(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b"ok"})
+
+def test_declared_oversized_body_takes_no_token(clock):
+    async def run():
+        app = RateLimitMiddleware(accept, limiter(max_body=10))
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://t") as client:
+            assert (await client.post("/api/letters", content=b"x" * 11)).status_code == 413
+            # The one-token IP bucket is still full
+            assert (await client.post("/api/letters", content=b"x")).status_code == 200
+            assert (await client.post("/api/letters", content=b"x")).status_code == 429
+    asyncio.run(run())